@@ -1,184 +1,1053 @@
-import cv2
+import io
+import mmap
+import os
+import time
+from array import array
+from collections import OrderedDict
 
-SUPPORTED_FILE_TYPES = ["png"]
+import numpy as np
 
+# The codec itself only needs numpy. cv2, PIL, concurrent.futures, multiprocessing and argparse are imported
+# where they are used, so "import my_qoi" stays cheap for short lived worker processes.
 
-def encode_RGBA(image, height, width):
-    output_bytes = bytearray()
-    prev_pixel: list[int] = [0, 0, 0, 255]
-    running_list = [[0, 0, 0, 0] for _ in range(64)]
-    run = 0
-    color_hash = 0
-    for h in range(height):
-        for w in range(width):
-            # Get the new pixel
-            pixel = image[h][w]  # pixel = [Blue, Green, Red, Alpha]
-            pixel = [int(chanel) for chanel in pixel]  # Convert to int from np.uint8
-
-            # Run
-            if pixel == prev_pixel and run < 62:
-                run += 1
-                continue
+SUPPORTED_FILE_TYPES = ["png"]
+END_MARK = b"\x00\x00\x00\x00\x00\x00\x00\x01"
 
-            if run > 0:
-                output_bytes.append(0b11000000 | (run - 1))
-                run = 0
 
-            color_hash = (pixel[2] * 3 + pixel[1] * 5 + pixel[0] * 7 + pixel[3] * 11) % 64
+def pack_pixels(image):
+    """
+    Arguments: image as a cv2 ndarray [b, g, r] or [b, g, r, a].
+    Output: flat memoryview of uint32 pixels packed as b | g << 8 | r << 16 | a << 24 (a = 0 for RGB).
+    """
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    if image.shape[2] == 4:
+        packed = image.view("<u4").reshape(-1)
+    else:
+        padded = np.zeros((image.shape[0] * image.shape[1], 4), dtype=np.uint8)
+        padded[:, :3] = image.reshape(-1, 3)
+        packed = padded.view("<u4").reshape(-1)
+    return memoryview(packed.astype(np.uint32, copy=False))
 
-            # Index
-            if pixel == running_list[color_hash] and pixel != prev_pixel:
-                output_bytes.append(color_hash)
 
-                prev_pixel = running_list[color_hash]
+class QOIStats:
+    """
+    Optional statistics collector for encode_RGB, encode_RGBA, decode_RGB and decode_RGBA (stats=QOIStats(chanels)).
+    The codec only hands over the chunks of every row and the time the row took; the chunks are replayed here,
+    so the pixel loops do not change and a disabled collector (stats=None) costs one check per row.
+        chunks: chunk name -> {"count", "bytes", "pixels"},
+        run_lengths: run_lengths[n - 1] is the number of QOI_OP_RUN chunks of length n,
+        index_lookups: chunks that looked up the running list (all but QOI_OP_RUN),
+        index_hits: lookups that ended as QOI_OP_INDEX,
+        index_collisions: lookups whose running list entry already held a different pixel,
+        row_seconds: encode or decode time of every row.
+    """
+
+    CHUNK_NAMES = ["QOI_OP_RGB", "QOI_OP_RGBA", "QOI_OP_INDEX", "QOI_OP_DIFF", "QOI_OP_LUMA", "QOI_OP_RUN"]
+
+    def __init__(self, chanels):
+        self.chanels = chanels
+        self.chunks = {name: {"count": 0, "bytes": 0, "pixels": 0} for name in self.CHUNK_NAMES}
+        self.run_lengths = [0] * 62
+        self.index_lookups = 0
+        self.index_hits = 0
+        self.index_collisions = 0
+        self.row_seconds = []
+        # Replay state, pixels are (r, g, b, a) tuples and None marks running list entries that were never written
+        self.pixel = (0, 0, 0, 255)
+        self.running_list = [None] * 64
+
+    def add_row(self, chunks, seconds):
+        self.add_chunks(chunks)
+        self.row_seconds.append(seconds)
+
+    def add_chunks(self, data):
+        """
+        Arguments: data (whole QOI chunks, in stream order).
+        """
+        chunks = self.chunks
+        run_lengths = self.run_lengths
+        running_list = self.running_list
+        r, g, b, a = self.pixel
+
+        byte_index = 0
+        while byte_index < len(data):
+            byte = data[byte_index]
+            if byte >= 0b11111110:
+                name, size = ("QOI_OP_RGBA", 5) if byte == 0b11111111 else ("QOI_OP_RGB", 4)
+                r, g, b = data[byte_index + 1], data[byte_index + 2], data[byte_index + 3]
+                if size == 5:
+                    a = data[byte_index + 4]
+            elif byte < 0b01000000:
+                name, size = "QOI_OP_INDEX", 1
+                entry = running_list[byte]
+                r, g, b, a = entry if entry is not None else (0, 0, 0, 255 if self.chanels == 3 else 0)
+            elif byte < 0b10000000:
+                name, size = "QOI_OP_DIFF", 1
+                r = (r + ((byte >> 4) & 0b11) - 2) & 0xFF
+                g = (g + ((byte >> 2) & 0b11) - 2) & 0xFF
+                b = (b + (byte & 0b11) - 2) & 0xFF
+            elif byte < 0b11000000:
+                name, size = "QOI_OP_LUMA", 2
+                dg = (byte & 0b00111111) - 32
+                r = (r + dg + (data[byte_index + 1] >> 4) - 8) & 0xFF
+                g = (g + dg) & 0xFF
+                b = (b + dg + (data[byte_index + 1] & 0b00001111) - 8) & 0xFF
+            else:
+                run = (byte & 0b00111111) + 1
+                chunks["QOI_OP_RUN"]["count"] += 1
+                chunks["QOI_OP_RUN"]["bytes"] += 1
+                chunks["QOI_OP_RUN"]["pixels"] += run
+                run_lengths[run - 1] += 1
+                byte_index += 1
                 continue
 
-            # Diff
-            diff = [pixel[i] - prev_pixel[i] for i in range(len(pixel))]
-            if -2 <= diff[0] <= 1 and -2 <= diff[1] <= 1 and -2 <= diff[2] <= 1 and diff[3] == 0 and pixel != prev_pixel:
-                output_bytes.append(0b01000000 | ((diff[2] + 2) << 4) | ((diff[1] + 2) << 2) | (diff[0] + 2))
+            chunks[name]["count"] += 1
+            chunks[name]["bytes"] += size
+            chunks[name]["pixels"] += 1
+            byte_index += size
+
+            pixel = (r, g, b, a)
+            color_hash = (r * 3 + g * 5 + b * 7 + a * 11) % 64
+            self.index_lookups += 1
+            if name == "QOI_OP_INDEX":
+                self.index_hits += 1
+            elif running_list[color_hash] is not None and running_list[color_hash] != pixel:
+                self.index_collisions += 1
+            running_list[color_hash] = pixel
+
+        self.pixel = (r, g, b, a)
+
+    def summary(self):
+        """
+        Output: dict with the chunk counts, run length histogram, running list hit and collision rates and row times.
+        """
+        lookups = max(self.index_lookups, 1)
+        rows = max(len(self.row_seconds), 1)
+        return {
+            "chunks": self.chunks,
+            "run_lengths": self.run_lengths,
+            "index_hit_rate": self.index_hits / lookups,
+            "index_collision_rate": self.index_collisions / lookups,
+            "rows": len(self.row_seconds),
+            "seconds_per_row": sum(self.row_seconds) / rows,
+            "max_seconds_per_row": max(self.row_seconds, default=0.0),
+        }
+
+
+def find_runs(pixels, height, width, min_length=8):
+    """
+    Finds runs of at least min_length identical pixels with numpy, so the encoders can skip over them.
+    Runs are split at row ends, so every run lies inside one row.
 
-                color_hash = (pixel[2] * 3 + pixel[1] * 5 + pixel[0] * 7 + pixel[3] * 11) % 64
-                running_list[color_hash] = pixel.copy()
-                prev_pixel = pixel.copy()
-                continue
+    Arguments: pixels: packed pixels (see pack_pixels), height and width of the image.
+    Output: (starts, ends): lists with the index of the second pixel of every run and the index after its last pixel.
+    """
+    n = height * width
+    if n == 0:
+        return [], []
 
-            # Luma
-            difg = diff[1]  # Green. pixel = [Blue, Green, Red] => diff = [Blue_diff, Green_diff, Red_diff]
-            drdg = diff[2] - diff[1]  # dr - dg = pixel[2] - prev_pixel[2] - (pixel[1] - prev_pixel[1])
-            dbdg = diff[0] - diff[1]  # db - dg = pixel[0] - prev_pixel[0] - (pixel[1] - prev_pixel[1])
-            if -32 <= difg <= 31 and -8 <= drdg <= 7 and -8 <= dbdg <= 7 and diff[3] == 0 and pixel != prev_pixel:
-                output_bytes.extend([0b10000000 | (difg + 32), (drdg + 8) << 4 | (dbdg + 8)])
+    packed = np.asarray(pixels)[:n]
+    new = np.ones(n, dtype=bool)
+    new[1:] = packed[1:] != packed[:-1]
+    new[::width] = True
+    starts = np.flatnonzero(new)
+    ends = np.append(starts[1:], n)
+    long = ends - starts >= min_length
+    return (starts[long] + 1).tolist(), ends[long].tolist()
 
-                color_hash = (pixel[2] * 3 + pixel[1] * 5 + pixel[0] * 7 + pixel[3] * 11) % 64
-                running_list[color_hash] = pixel.copy()
-                prev_pixel = pixel.copy()
-                continue
 
-            output_bytes.extend([int(0b11111111), pixel[2], pixel[1], pixel[0], pixel[3]])
-            running_list[color_hash] = pixel.copy()
-            prev_pixel = pixel.copy()
+def encode_RGBA(image, height, width, stats=None):
+    output_bytes = bytearray()
+    # Pixels are packed ints b | g << 8 | r << 16 | a << 24, so comparing and storing them allocates nothing
+    prev_pixel = 0xFF000000  # [0, 0, 0, 255]
+    running_list = array("I", bytes(4 * 64))
+    run = 0
+    pixels = pack_pixels(image)
+    # Long runs are found with numpy and written without looking at their pixels one by one
+    run_starts, run_ends = find_runs(pixels, height, width)
+    next_run = 0
+    for h in range(height):
+        if stats is not None:
+            row_start, row_time = len(output_bytes), time.perf_counter()
+        position = h * width
+        row_end = position + width
+        while position < row_end:
+            span_end = row_end
+            if next_run < len(run_starts) and run_starts[next_run] < row_end:
+                span_end = run_starts[next_run]
+            for pixel in pixels[position:span_end]:
+                # Run
+                if pixel == prev_pixel and run < 62:
+                    run += 1
+                    continue
+
+                if run > 0:
+                    output_bytes.append(0b11000000 | (run - 1))
+                    run = 0
+
+                b = pixel & 0xFF
+                g = (pixel >> 8) & 0xFF
+                r = (pixel >> 16) & 0xFF
+                a = pixel >> 24
+                color_hash = (r * 3 + g * 5 + b * 7 + a * 11) % 64
+
+                # Index
+                if pixel == running_list[color_hash] and pixel != prev_pixel:
+                    output_bytes.append(color_hash)
+
+                    prev_pixel = pixel
+                    continue
+
+                # Diff
+                db = b - (prev_pixel & 0xFF)
+                dg = g - ((prev_pixel >> 8) & 0xFF)
+                dr = r - ((prev_pixel >> 16) & 0xFF)
+                same_alpha = a == prev_pixel >> 24
+                if -2 <= db <= 1 and -2 <= dg <= 1 and -2 <= dr <= 1 and same_alpha and pixel != prev_pixel:
+                    output_bytes.append(0b01000000 | ((dr + 2) << 4) | ((dg + 2) << 2) | (db + 2))
+
+                    running_list[color_hash] = pixel
+                    prev_pixel = pixel
+                    continue
+
+                # Luma
+                drdg = dr - dg
+                dbdg = db - dg
+                if -32 <= dg <= 31 and -8 <= drdg <= 7 and -8 <= dbdg <= 7 and same_alpha and pixel != prev_pixel:
+                    output_bytes.append(0b10000000 | (dg + 32))
+                    output_bytes.append((drdg + 8) << 4 | (dbdg + 8))
+
+                    running_list[color_hash] = pixel
+                    prev_pixel = pixel
+                    continue
+
+                output_bytes.append(0b11111111)
+                output_bytes.append(r)
+                output_bytes.append(g)
+                output_bytes.append(b)
+                output_bytes.append(a)
+                running_list[color_hash] = pixel
+                prev_pixel = pixel
+
+            if span_end == row_end:
+                break
+
+            # A run longer than 62 pixels is written as 62 run, one QOI_OP_RGBA pixel, 62 run, ...
+            cycles, run = divmod(run + run_ends[next_run] - span_end, 63)
+            if cycles:
+                b = prev_pixel & 0xFF
+                g = (prev_pixel >> 8) & 0xFF
+                r = (prev_pixel >> 16) & 0xFF
+                a = prev_pixel >> 24
+                output_bytes.extend(bytes([0b11111101, 0b11111111, r, g, b, a]) * cycles)
+                running_list[(r * 3 + g * 5 + b * 7 + a * 11) % 64] = prev_pixel
+            position = run_ends[next_run]
+            next_run += 1
+
+        if stats is not None:
+            stats.add_row(output_bytes[row_start:], time.perf_counter() - row_time)
 
     # Run flush
     if run > 0:
         output_bytes.append(0b11000000 | (run - 1))
+        if stats is not None:
+            stats.add_chunks(output_bytes[-1:])
 
     return output_bytes
 
 
-def encode_RGB(image, height, width):
+def encode_RGB(image, height, width, stats=None):
     output_bytes = bytearray()
-    prev_pixel: list[int] = [0, 0, 0]
-    running_list = [[0, 0, 0] for _ in range(64)]
+    # Pixels are packed ints b | g << 8 | r << 16, so comparing and storing them allocates nothing
+    prev_pixel = 0  # [0, 0, 0]
+    running_list = array("I", bytes(4 * 64))
     run = 0
-    color_hash = 0
+    pixels = pack_pixels(image)
+    # Long runs are found with numpy and written without looking at their pixels one by one
+    run_starts, run_ends = find_runs(pixels, height, width)
+    next_run = 0
     for h in range(height):
-        for w in range(width):
-            # Get the new pixel
-            pixel = image[h][w]  # pixel = [Blue, Green, Red]
-            pixel = [int(chanel) for chanel in pixel]  # Convert to int from np.uint8
-
-            # Run
-            if pixel == prev_pixel and run < 62:
-                run += 1
-                continue
+        if stats is not None:
+            row_start, row_time = len(output_bytes), time.perf_counter()
+        position = h * width
+        row_end = position + width
+        while position < row_end:
+            span_end = row_end
+            if next_run < len(run_starts) and run_starts[next_run] < row_end:
+                span_end = run_starts[next_run]
+            for pixel in pixels[position:span_end]:
+                # Run
+                if pixel == prev_pixel and run < 62:
+                    run += 1
+                    continue
+
+                if run > 0:
+                    output_bytes.append(0b11000000 | (run - 1))
+                    run = 0
+
+                b = pixel & 0xFF
+                g = (pixel >> 8) & 0xFF
+                r = pixel >> 16
+                color_hash = (r * 3 + g * 5 + b * 7 + 255 * 11) % 64
+
+                # Index
+                if pixel == running_list[color_hash] and pixel != prev_pixel:
+                    output_bytes.append(color_hash)
+
+                    prev_pixel = pixel
+                    continue
+
+                # Diff
+                db = b - (prev_pixel & 0xFF)
+                dg = g - ((prev_pixel >> 8) & 0xFF)
+                dr = r - (prev_pixel >> 16)
+                if -2 <= db <= 1 and -2 <= dg <= 1 and -2 <= dr <= 1 and pixel != prev_pixel:
+                    output_bytes.append(0b01000000 | ((dr + 2) << 4) | ((dg + 2) << 2) | (db + 2))
+
+                    running_list[color_hash] = pixel
+                    prev_pixel = pixel
+                    continue
+
+                # Luma
+                drdg = dr - dg
+                dbdg = db - dg
+                if -32 <= dg <= 31 and -8 <= drdg <= 7 and -8 <= dbdg <= 7 and pixel != prev_pixel:
+                    output_bytes.append(0b10000000 | (dg + 32))
+                    output_bytes.append((drdg + 8) << 4 | (dbdg + 8))
+
+                    running_list[color_hash] = pixel
+                    prev_pixel = pixel
+                    continue
+
+                output_bytes.append(0b11111110)
+                output_bytes.append(r)
+                output_bytes.append(g)
+                output_bytes.append(b)
+                running_list[color_hash] = pixel
+                prev_pixel = pixel
+
+            if span_end == row_end:
+                break
+
+            # A run longer than 62 pixels is written as 62 run, one QOI_OP_RGB pixel, 62 run, ...
+            cycles, run = divmod(run + run_ends[next_run] - span_end, 63)
+            if cycles:
+                b = prev_pixel & 0xFF
+                g = (prev_pixel >> 8) & 0xFF
+                r = prev_pixel >> 16
+                output_bytes.extend(bytes([0b11111101, 0b11111110, r, g, b]) * cycles)
+                running_list[(r * 3 + g * 5 + b * 7 + 255 * 11) % 64] = prev_pixel
+            position = run_ends[next_run]
+            next_run += 1
+
+        if stats is not None:
+            stats.add_row(output_bytes[row_start:], time.perf_counter() - row_time)
 
-            if run > 0:
-                output_bytes.append(0b11000000 | (run - 1))
-                run = 0
-
-            color_hash = (pixel[2] * 3 + pixel[1] * 5 + pixel[0] * 7 + 255 * 11) % 64
+    # Run flush
+    if run > 0:
+        output_bytes.append(0b11000000 | (run - 1))
+        if stats is not None:
+            stats.add_chunks(output_bytes[-1:])
 
-            # Index
-            if pixel == running_list[color_hash] and pixel != prev_pixel:
-                output_bytes.append(color_hash)
+    return output_bytes
 
-                prev_pixel = running_list[color_hash]
-                continue
 
-            # Diff
-            diff = [pixel[i] - prev_pixel[i] for i in range(len(pixel))]
-            if -2 <= diff[0] <= 1 and -2 <= diff[1] <= 1 and -2 <= diff[2] <= 1 and pixel != prev_pixel:
-                output_bytes.append(0b01000000 | ((diff[2] + 2) << 4) | ((diff[1] + 2) << 2) | (diff[0] + 2))
+# Pixels encode_vectorized classifies at once when it encodes a whole image (about 30 MB of temporaries)
+BAND_PIXELS = 1 << 18
 
-                color_hash = (pixel[2] * 3 + pixel[1] * 5 + pixel[0] * 7 + 255 * 11) % 64
-                running_list[color_hash] = pixel.copy()
-                prev_pixel = pixel.copy()
-                continue
 
-            # Luma
-            difg = diff[1]  # Green. pixel = [Blue, Green, Red] => diff = [Blue_diff, Green_diff, Red_diff]
-            drdg = diff[2] - diff[1]  # dr - dg = pixel[2] - prev_pixel[2] - (pixel[1] - prev_pixel[1])
-            dbdg = diff[0] - diff[1]  # db - dg = pixel[0] - prev_pixel[0] - (pixel[1] - prev_pixel[1])
-            if -32 <= difg <= 31 and -8 <= drdg <= 7 and -8 <= dbdg <= 7 and pixel != prev_pixel:
-                output_bytes.extend([0b10000000 | (difg + 32), (drdg + 8) << 4 | (dbdg + 8)])
+class EncoderState:
+    """
+    Encoder state that is carried from one chunk of rows to the next one.
+        prev_pixel: the last encoded pixel [b, g, r] or [b, g, r, a],
+        running_list: the 64 running list entries as packed pixels (b | g << 8 | r << 16 | a << 24),
+        run: the length of the run that has not been written yet.
+    """
 
-                color_hash = (pixel[2] * 3 + pixel[1] * 5 + pixel[0] * 7 + 255 * 11) % 64
-                running_list[color_hash] = pixel.copy()
-                prev_pixel = pixel.copy()
-                continue
+    def __init__(self, chanels):
+        self.chanels = chanels
+        self.prev_pixel = [0, 0, 0, 255][:chanels]
+        self.running_list = np.zeros(64, dtype=np.uint32)
+        self.run = 0
 
-            output_bytes.extend([int(0b11111110), pixel[2], pixel[1], pixel[0]])
-            running_list[color_hash] = pixel.copy()
-            prev_pixel = pixel.copy()
 
-    # Run flush
-    if run > 0:
-        output_bytes.append(0b11000000 | (run - 1))
+def encode_vectorized(image, height, width, state=None):
+    """
+    Same output as encode_RGB / encode_RGBA, but the pixels are classified with numpy.
+    The temporaries take about 110 bytes per pixel, so without a state the image is encoded in bands of
+    BAND_PIXELS pixels with one EncoderState (the output does not depend on where the bands are cut).
+
+    Arguments: image as a cv2 ndarray [b, g, r] or [b, g, r, a], height and width of the image,
+               state: EncoderState to continue from. The state is updated and the last run is left
+                      unwritten, so the next chunk of rows can continue it. The chunk is encoded at once.
+    Output: bytearray with the QOI chunks (without header and ending mark).
+    """
+    chanels = image.shape[2]
+    n = height * width
+    if state is None:
+        state = EncoderState(chanels)
+        pixels = np.ascontiguousarray(image, dtype=np.uint8).reshape(1, n, chanels)
+        output_bytes = bytearray()
+        for start in range(0, n, BAND_PIXELS):
+            band = pixels[:, start : start + BAND_PIXELS]
+            output_bytes.extend(encode_vectorized(band, 1, band.shape[1], state))
+
+        # Run flush
+        if state.run > 0:
+            output_bytes.append(0b11000000 | (state.run - 1))
+        return output_bytes
+
+    pixels = np.ascontiguousarray(image, dtype=np.uint8).reshape(n, chanels).astype(np.int16)
+    if n == 0:
+        return bytearray()
+
+    # Previous pixel of every pixel. The first one is compared to the starting pixel.
+    prev = np.empty_like(pixels)
+    prev[1:] = pixels[:-1]
+    prev[0] = state.prev_pixel
+
+    b, g, r = pixels[:, 0], pixels[:, 1], pixels[:, 2]
+    a = pixels[:, 3] if chanels == 4 else np.full(n, 255, dtype=np.int16)
+    same = (pixels == prev).all(axis=1)
+
+    # Pixels packed to one int, so equality with the running list can be checked in one compare.
+    packed = b.astype(np.uint32) | (g.astype(np.uint32) << 8) | (r.astype(np.uint32) << 16)
+    if chanels == 4:
+        packed |= a.astype(np.uint32) << 24
+    color_hash = (r * 3 + g * 5 + b * 7 + a * 11) % 64
+
+    # Run
+    # k = position of the pixel in the current stretch of pixels equal to the previous one.
+    index = np.arange(n)
+    last_different = np.maximum.accumulate(np.where(same, -1, index))
+    k = np.where(same, index - last_different, 0)
+    k[last_different == -1] += state.run
+    # A run is at most 62 long, the 63rd equal pixel is written as a whole pixel.
+    is_run = same & (k % 63 != 0)
+    run_before = np.zeros(n, dtype=np.int64)
+    run_before[1:] = k[:-1] % 63
+    run_before[0] = state.run
+
+    # Index
+    # Every pixel that is not a part of a run is written to the running list, so the running list
+    # entry a pixel sees is the last earlier written pixel with the same hash.
+    written = np.flatnonzero(~is_run)
+    order = written[np.argsort(color_hash[written], kind="stable")]
+    seen = np.empty(len(order), dtype=np.uint32)
+    seen[1:] = packed[order[:-1]]
+    first_in_slot = np.ones(len(order), dtype=bool)
+    first_in_slot[1:] = color_hash[order[1:]] != color_hash[order[:-1]]
+    seen[first_in_slot] = state.running_list[color_hash[order[first_in_slot]]]
+    is_index = np.zeros(n, dtype=bool)
+    is_index[order] = packed[order] == seen
+    is_index &= ~same
+
+    # Diff
+    diff = pixels - prev
+    db, dg, dr = diff[:, 0], diff[:, 1], diff[:, 2]
+    same_alpha = diff[:, 3] == 0 if chanels == 4 else np.ones(n, dtype=bool)
+    rest = ~same & ~is_index & same_alpha
+    is_diff = rest & ((diff[:, :3] >= -2) & (diff[:, :3] <= 1)).all(axis=1)
+
+    # Luma
+    drdg = dr - dg
+    dbdg = db - dg
+    rest &= ~is_diff
+    is_luma = rest & (-32 <= dg) & (dg <= 31) & (-8 <= drdg) & (drdg <= 7) & (-8 <= dbdg) & (dbdg <= 7)
+
+    is_whole = ~is_run & ~is_index & ~is_diff & ~is_luma
+
+    # Every pixel gets a row of possible output bytes: [run flush, chunk bytes...]
+    table = np.zeros((n, 6), dtype=np.uint8)
+    lengths = np.zeros(n, dtype=np.int64)
+    valid = np.zeros((n, 6), dtype=bool)
+
+    flush = ~is_run & (run_before > 0)
+    table[:, 0] = 0b11000000 | (run_before - 1) & 0b00111111
+    valid[:, 0] = flush
+
+    table[is_index, 1] = color_hash[is_index]
+    lengths[is_index] = 1
+
+    table[is_diff, 1] = 0b01000000 | ((dr[is_diff] + 2) << 4) | ((dg[is_diff] + 2) << 2) | (db[is_diff] + 2)
+    lengths[is_diff] = 1
+
+    table[is_luma, 1] = 0b10000000 | (dg[is_luma] + 32)
+    table[is_luma, 2] = ((drdg[is_luma] + 8) << 4) | (dbdg[is_luma] + 8)
+    lengths[is_luma] = 2
+
+    table[is_whole, 1] = 0b11111111 if chanels == 4 else 0b11111110
+    table[is_whole, 2] = r[is_whole]
+    table[is_whole, 3] = g[is_whole]
+    table[is_whole, 4] = b[is_whole]
+    if chanels == 4:
+        table[is_whole, 5] = a[is_whole]
+    lengths[is_whole] = chanels + 1
+
+    valid[:, 1:] = np.arange(5) < lengths[:, None]
+
+    output_bytes = bytearray(table[valid].tobytes())
+
+    # Save the state for the next chunk
+    last_in_slot = np.ones(len(order), dtype=bool)
+    last_in_slot[:-1] = first_in_slot[1:]
+    state.running_list[color_hash[order[last_in_slot]]] = packed[order[last_in_slot]]
+    state.prev_pixel = [int(chanel) for chanel in pixels[-1]]
+    state.run = int(k[-1] % 63) if is_run[-1] else 0
 
     return output_bytes
 
 
-def encode(img):
+# Optional entropy stage after the QOI chunks. The method byte of a qoiz file is the index in this list.
+COMPRESSION_METHODS = ["none", "zlib", "lzma"]
+
+
+def make_compressor(method):
+    if method == "zlib":
+        import zlib
+
+        return zlib.compressobj(6)
+    if method == "lzma":
+        import lzma
+
+        return lzma.LZMACompressor()
+    raise ValueError(f"Unknown compression {method}")
+
+
+def make_decompressor(method):
+    if method == "zlib":
+        import zlib
+
+        return zlib.decompressobj()
+    if method == "lzma":
+        import lzma
+
+        return lzma.LZMADecompressor()
+    raise ValueError(f"Unknown compression {method}")
+
+
+def choose_compression(data, sample_size=1 << 16, pieces=4):
     """
-    Arguments: File path to an image that is not in the QOI format and can be read by cv2.
-    Output: Image object:
-                height: the height of the image,
-                width: the width of the image,
-                chanels: "RGB" or "RGBA",
-                colorspace: "sRGB" or "linear",
-                data: the pixel data [b, g, r] or [b, g, r, a],
-                binary: the binary data for the QOI format.
+    Compresses a few pieces of the QOI chunks with the fastest settings and picks the method.
+    lzma is only used when it is clearly better, because it is several times slower than zlib.
+
+    Arguments: data (QOI chunks), sample_size: bytes sampled in total, pieces: number of places they are taken from.
+    Output: "none", "zlib" or "lzma".
     """
-    image = cv2.imread(img, cv2.IMREAD_UNCHANGED)
+    import lzma
+    import zlib
 
-    if len(image.shape) == 2:
-        raise ValueError("QOI format does not support B/W images")
+    piece_size = sample_size // pieces
+    if len(data) <= sample_size:
+        sample = bytes(data)
+    else:
+        step = (len(data) - piece_size) // (pieces - 1)
+        sample = b"".join(bytes(data[i * step : i * step + piece_size]) for i in range(pieces))
+    if not sample:
+        return "none"
 
-    if image.shape[2] == 2:
-        raise ValueError("QOI format does not support grayscale images")
+    zlib_ratio = len(zlib.compress(sample, 1)) / len(sample)
+    lzma_ratio = len(lzma.compress(sample, preset=0)) / len(sample)
+    if lzma_ratio < 0.9 * zlib_ratio:
+        return "lzma"
+    if zlib_ratio < 0.95:
+        return "zlib"
+    return "none"
 
-    h = image.shape[0]
-    w = image.shape[1]
-    is_RGBA = image.shape[2] == 4
 
-    output_bytes: bytearray = bytearray()
+def read_some(stream, size):
+    """
+    Reads at most size bytes, but only waits for the first ones: read1 when the stream has it
+    (buffered files and socket.makefile("rb")), else read (raw streams already return what has arrived).
+    """
+    read1 = getattr(stream, "read1", None)
+    return read1(size) if read1 is not None else stream.read(size)
+
+
+class DecompressedStream:
+    """
+    Binary file-like reader over the compressed part of a qoiz file. read() returns the QOI chunks and,
+    after the compressed stream ends, the raw bytes that follow it (the ending mark).
+    At most block_size bytes are decompressed at once, so highly compressed runs do not blow up memory.
+    """
+
+    def __init__(self, stream, method, block_size=1 << 16):
+        self.stream = stream
+        self.method = method
+        self.block_size = block_size
+        self.decompressor = make_decompressor(method)
+        self.buffer = bytearray()
+        self.tail_read = False
+
+    def fill(self):
+        """
+        Output: False when there is nothing more to read.
+        """
+        decompressor = self.decompressor
+        if decompressor.eof:
+            if not self.tail_read:
+                self.tail_read = True
+                self.buffer.extend(decompressor.unused_data)
+                return True
+            block = read_some(self.stream, self.block_size)
+            self.buffer.extend(block)
+            return bool(block)
+
+        if self.method == "zlib":
+            block = decompressor.unconsumed_tail or read_some(self.stream, self.block_size)
+        else:
+            block = read_some(self.stream, self.block_size) if decompressor.needs_input else b""
+        if not block and (self.method == "zlib" or decompressor.needs_input):
+            return False
+        self.buffer.extend(decompressor.decompress(block, self.block_size))
+        return True
+
+    def read(self, size=-1):
+        while (size < 0 or len(self.buffer) < size) and self.fill():
+            pass
+        size = len(self.buffer) if size < 0 else size
+        output = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return output
+
+    def read1(self, size=-1):
+        """
+        Like read, but returns as soon as some bytes are decompressed.
+        """
+        while not self.buffer and self.fill():
+            pass
+        return self.read(len(self.buffer) if size < 0 else min(size, len(self.buffer)))
+
+
+def decompress_file(file):
+    """
+    Arguments: the whole qoiz file.
+    Output: bytearray with the same image as a plain QOI file.
+    """
+    if len(file) < 15 + 8 or file[0:4] != "qoiz".encode("ascii") or file[14] >= len(COMPRESSION_METHODS):
+        raise ValueError("Not qoiz file.")
+
+    decompressor = make_decompressor(COMPRESSION_METHODS[file[14]])
+    output_bytes = bytearray("qoif".encode("ascii"))
+    output_bytes.extend(file[4:14])
+    output_bytes.extend(decompressor.decompress(memoryview(file)[15:]))
+    if not decompressor.eof or decompressor.unused_data != END_MARK:
+        raise ValueError("Not qoiz file.")
 
-    # Header
+    # Ending mark
+    output_bytes.extend(END_MARK)
+    return output_bytes
+
+
+def encode_header(width, height, chanels, colorspace="linear"):
+    """
+    Arguments: width and height of the image, chanels: 3 or 4, colorspace: "sRGB" or "linear".
+    Output: the 14 byte QOI header.
+    """
+    output_bytes = bytearray()
     output_bytes.extend("qoif".encode("ascii"))  # File signature
-    output_bytes.extend(w.to_bytes(length=4, byteorder="big"))  # Width
-    output_bytes.extend(h.to_bytes(length=4, byteorder="big"))  # Height
+    output_bytes.extend(width.to_bytes(length=4, byteorder="big"))  # Width
+    output_bytes.extend(height.to_bytes(length=4, byteorder="big"))  # Height
 
-    if is_RGBA:
+    if chanels == 4:
         output_bytes.append(0b00000100)  # Chanels
     else:
         output_bytes.append(0b00000011)  # Chanels
 
-    is_SRGB: bool = False  # Typically false. TODO: Detection
-    if is_SRGB:
+    if colorspace == "sRGB":
         output_bytes.append(0b00000000)  # Colorspace
     else:
         output_bytes.append(0b00000001)  # Colorspace
 
-    if is_RGBA:
-        data = encode_RGBA(image, h, w)
+    return output_bytes
+
+
+class QOIWriter:
+    """
+    Streaming encoder. The header is written first, then rows can be written in chunks of any size.
+    Only the current chunk and at most buffer_size output bytes are kept in memory.
+    With compression ("zlib", "lzma" or "auto") the chunks go through the entropy stage and a qoiz file is written:
+    "qoiz" instead of "qoif", the usual header fields, the method byte (see COMPRESSION_METHODS),
+    the compressed chunks and the ending mark. "auto" picks the method from the first buffer_size bytes.
+
+    Usage:
+        with QOIWriter(f, width, height, chanels=3) as writer:
+            for rows in tiles:
+                writer.write(rows)
+    """
+
+    def __init__(self, sink, width, height, chanels=3, colorspace="linear", buffer_size=1 << 16, compression=None):
+        if chanels not in (3, 4):
+            raise ValueError("QOI format supports only 3 or 4 chanels")
+        if compression not in (None, "auto", *COMPRESSION_METHODS):
+            raise ValueError(f"Unknown compression {compression}")
+
+        self.sink = sink
+        self.width = width
+        self.height = height
+        self.chanels = chanels
+        self.buffer_size = buffer_size
+        self.rows_written = 0
+        self.state = EncoderState(chanels)
+        self.compression = compression
+        self.compressor = None
+        self.header = encode_header(width, height, chanels, colorspace)
+        self.buffer = bytearray()
+
+    def write(self, rows):
+        """
+        Arguments: one row of shape (width, chanels) or a chunk of rows of shape (rows, width, chanels).
+        """
+        rows = np.asarray(rows, dtype=np.uint8)
+        if rows.ndim == 2:
+            rows = rows[np.newaxis]
+        if rows.shape[1:] != (self.width, self.chanels):
+            raise ValueError(f"Rows must have the shape (rows, {self.width}, {self.chanels}), got {rows.shape}")
+        if self.rows_written + rows.shape[0] > self.height:
+            raise ValueError("More rows written than the height of the image")
+
+        self.buffer.extend(encode_vectorized(rows, rows.shape[0], self.width, self.state))
+        self.rows_written += rows.shape[0]
+
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        # The header goes out with the first buffer, so "auto" can look at the chunks first
+        if self.header is not None:
+            method = choose_compression(self.buffer) if self.compression == "auto" else self.compression
+            if method not in (None, "none"):
+                self.header[0:4] = "qoiz".encode("ascii")
+                self.header.append(COMPRESSION_METHODS.index(method))
+                self.compressor = make_compressor(method)
+            self.sink.write(self.header)
+            self.header = None
+
+        if self.compressor is not None:
+            self.sink.write(self.compressor.compress(self.buffer))
+        else:
+            self.sink.write(self.buffer)
+        self.buffer = bytearray()
+
+    def write_rows(self, rows):
+        """
+        Arguments: iterable of rows or chunks of rows (for example tiles from a large scan).
+        """
+        for chunk in rows:
+            self.write(chunk)
+
+    def close(self):
+        if self.rows_written != self.height:
+            raise ValueError(f"Only {self.rows_written} of {self.height} rows were written")
+
+        # Run flush
+        if self.state.run > 0:
+            self.buffer.append(0b11000000 | (self.state.run - 1))
+            self.state.run = 0
+
+        self.flush()
+        if self.compressor is not None:
+            self.sink.write(self.compressor.flush())
+        self.sink.write(END_MARK)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+
+def encode_stream(rows, sink, width, height, chanels=3, colorspace="linear", compression=None):
+    """
+    Arguments: iterable of rows or chunks of rows [b, g, r] or [b, g, r, a],
+               sink: binary file-like object the QOI file is written to,
+               width and height of the image, chanels: 3 or 4, colorspace: "sRGB" or "linear",
+               compression: None, "zlib", "lzma" or "auto" (see QOIWriter).
+    """
+    with QOIWriter(sink, width, height, chanels, colorspace, compression=compression) as writer:
+        writer.write_rows(rows)
+
+
+def encode_strip(strip):
+    """
+    Encodes one strip of rows with a fresh encoder state. Used by encode_strips in the worker processes.
+    """
+    return encode_vectorized(strip, strip.shape[0], strip.shape[1])
+
+
+def encode_strips(image, strip_height=64, colorspace="linear", workers=1):
+    """
+    Encodes the image into the strip container. Every strip of strip_height rows starts with a fresh
+    encoder state, so strips can be encoded and decoded independently and in parallel.
+
+    Layout:
+        "qoit", width (4 B), height (4 B), chanels (1 B), colorspace (1 B),
+        strip_height (4 B), number of strips n (4 B),
+        n + 1 file offsets (8 B each) of the strip starts and of the ending mark,
+        QOI chunks of every strip, ending mark.
+
+    Arguments: image as a cv2 ndarray [b, g, r] or [b, g, r, a], strip_height: rows per strip,
+               colorspace: "sRGB" or "linear", workers: number of processes used for encoding.
+    Output: bytearray with the whole container.
+    """
+    h, w, chanels = image.shape
+    strips = [image[y : y + strip_height] for y in range(0, h, strip_height)]
+
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            encoded = list(executor.map(encode_strip, strips))
     else:
-        data = encode_RGB(image, h, w)
+        encoded = [encode_strip(strip) for strip in strips]
+
+    output_bytes = encode_header(w, h, chanels, colorspace)
+    output_bytes[0:4] = "qoit".encode("ascii")
+    output_bytes.extend(strip_height.to_bytes(length=4, byteorder="big"))
+    output_bytes.extend(len(strips).to_bytes(length=4, byteorder="big"))
+
+    offset = len(output_bytes) + (len(strips) + 1) * 8
+    for data in encoded:
+        output_bytes.extend(offset.to_bytes(length=8, byteorder="big"))
+        offset += len(data)
+    output_bytes.extend(offset.to_bytes(length=8, byteorder="big"))
 
-    output_bytes.extend(data)
+    for data in encoded:
+        output_bytes.extend(data)
 
     # Ending mark
-    output_bytes.extend(b"\x00\x00\x00\x00\x00\x00\x00\x01")
+    output_bytes.extend(END_MARK)
+    return output_bytes
+
+
+CHECKPOINT_DTYPE = np.dtype(
+    [
+        ("row", ">u4"),
+        ("offset", ">u8"),  # File offset of the first chunk of the row
+        ("run", "u1"),  # Pixels of the run at offset that belong to the previous rows
+        ("pixel", "u1", 4),  # Previous pixel [b, g, r, a]
+        ("running_list", ">u4", 64),  # Packed pixels b | g << 8 | r << 16 | a << 24
+    ]
+)
+
+
+def encode_checkpoints(image, height, width, checkpoint_rows=64):
+    """
+    Encodes the image (same output as encode_vectorized) and records a checkpoint every checkpoint_rows rows.
+    A checkpoint has everything the decoder needs to start at that row: the byte offset, the previous pixel,
+    the running list and how much of the run at that offset belongs to the rows before.
+
+    Index layout: "qidx", checkpoint_rows (4 B), number of checkpoints (4 B), size of the QOI file (8 B),
+    checkpoints (CHECKPOINT_DTYPE). decode_rows ignores an index whose file size does not match the image.
+
+    Arguments: image as a cv2 ndarray [b, g, r] or [b, g, r, a], height and width of the image,
+               checkpoint_rows: rows between two checkpoints.
+    Output: (bytearray with the QOI chunks, bytearray with the checkpoint index)
+    """
+    chanels = image.shape[2]
+    state = EncoderState(chanels)
+    output_bytes = bytearray()
+
+    checkpoints = np.zeros(len(range(0, height, checkpoint_rows)), dtype=CHECKPOINT_DTYPE)
+    for i, y in enumerate(range(0, height, checkpoint_rows)):
+        checkpoints[i]["row"] = y
+        checkpoints[i]["offset"] = 14 + len(output_bytes)
+        checkpoints[i]["run"] = state.run
+        checkpoints[i]["pixel"] = (state.prev_pixel + [255])[:4]
+        checkpoints[i]["running_list"] = state.running_list
+
+        rows = image[y : y + checkpoint_rows]
+        output_bytes.extend(encode_vectorized(rows, rows.shape[0], width, state))
+
+    # Run flush
+    if state.run > 0:
+        output_bytes.append(0b11000000 | (state.run - 1))
+
+    index = bytearray("qidx".encode("ascii"))
+    index.extend(checkpoint_rows.to_bytes(length=4, byteorder="big"))
+    index.extend(len(checkpoints).to_bytes(length=4, byteorder="big"))
+    index.extend((14 + len(output_bytes) + len(END_MARK)).to_bytes(length=8, byteorder="big"))
+    index.extend(checkpoints.tobytes())
+    return output_bytes, index
+
+
+KEY_FRAME = 0
+INTER_FRAME = 1
+
+
+def encode_inter_frame(frame, prev_frame):
+    """
+    Codes the pixels that are unchanged from prev_frame as spans and the changed ones with the normal QOI chunks.
+
+    Layout: number of spans m (4 B), m span lengths (4 B each) that alternate between unchanged and changed
+            pixels and start with unchanged ones, QOI chunks of the changed pixels (as one row, fresh encoder state).
+
+    Output: (bytearray with the frame, share of changed pixels)
+    """
+    h, w, chanels = frame.shape
+    pixels = np.ascontiguousarray(frame).reshape(h * w, chanels)
+    changed = np.any(pixels != prev_frame.reshape(h * w, chanels), axis=1)
+
+    edges = np.flatnonzero(changed[1:] != changed[:-1]) + 1
+    spans = np.diff(np.concatenate(([0], edges, [h * w])))
+    if changed[0]:
+        spans = np.concatenate(([0], spans))
+
+    changed_pixels = pixels[changed]
+    output_bytes = bytearray(len(spans).to_bytes(length=4, byteorder="big"))
+    output_bytes.extend(spans.astype(">u4").tobytes())
+    output_bytes.extend(encode_vectorized(changed_pixels[np.newaxis], 1, len(changed_pixels)))
+    return output_bytes, len(changed_pixels) / (h * w)
+
+
+def encode_sequence(frames, colorspace="linear", inter=True, keyframe_interval=0, max_changed=0.5):
+    """
+    Encodes frames of the same size into the sequence container. Key frames are normal QOI chunks,
+    inter frames only code the pixels that changed since the previous frame (see encode_inter_frame).
+
+    Layout:
+        "qois", width (4 B), height (4 B), chanels (1 B), colorspace (1 B),
+        number of frames n (4 B), n frame types (1 B each, 0 key frame, 1 inter frame),
+        n + 1 file offsets (8 B each) of the frame starts and of the ending mark,
+        frame data, ending mark.
+
+    Arguments: frames: iterable of cv2 ndarrays [b, g, r] or [b, g, r, a], colorspace: "sRGB" or "linear",
+               inter: use inter frames, keyframe_interval: force a key frame every that many frames (0 = never),
+               max_changed: frames with a larger share of changed pixels are stored as key frames.
+    Output: bytearray with the whole container.
+    """
+    types = bytearray()
+    encoded = []
+    prev_frame = None
+    for i, frame in enumerate(frames):
+        if prev_frame is None:
+            shape = frame.shape
+        elif frame.shape != shape:
+            raise ValueError(f"Frame {i} has shape {frame.shape}, expected {shape}")
+
+        data = None
+        if inter and prev_frame is not None and not (keyframe_interval and i % keyframe_interval == 0):
+            data, changed = encode_inter_frame(frame, prev_frame)
+            if changed > max_changed:
+                data = None
+
+        if data is None:
+            types.append(KEY_FRAME)
+            encoded.append(encode_vectorized(frame, shape[0], shape[1]))
+        else:
+            types.append(INTER_FRAME)
+            encoded.append(data)
+        prev_frame = frame
+
+    if prev_frame is None:
+        raise ValueError("No frames to encode")
+
+    output_bytes = encode_header(shape[1], shape[0], shape[2], colorspace)
+    output_bytes[0:4] = "qois".encode("ascii")
+    output_bytes.extend(len(encoded).to_bytes(length=4, byteorder="big"))
+    output_bytes.extend(types)
+
+    offset = len(output_bytes) + (len(encoded) + 1) * 8
+    for data in encoded:
+        output_bytes.extend(offset.to_bytes(length=8, byteorder="big"))
+        offset += len(data)
+    output_bytes.extend(offset.to_bytes(length=8, byteorder="big"))
+
+    for data in encoded:
+        output_bytes.extend(data)
+
+    # Ending mark
+    output_bytes.extend(END_MARK)
+    return output_bytes
+
+
+def encode_array(
+    image,
+    chanels=None,
+    colorspace="linear",
+    order="BGR",
+    width=None,
+    height=None,
+    vectorized=True,
+    strip_height=None,
+    checkpoint_rows=None,
+    compression=None,
+):
+    """
+    Encodes pixels that are already in memory, without reading or writing any file.
+
+    Arguments: image: numpy array of shape (height, width, chanels) or any other C-contiguous uint8 buffer
+                      (bytes, bytearray, memoryview, ...) together with width, height and chanels,
+               chanels: 3 or 4 (taken from the array shape if not given),
+               colorspace: "sRGB" or "linear",
+               order: "BGR" (cv2) or "RGB" (PIL, most other libraries) order of the chanels,
+               vectorized, strip_height, checkpoint_rows, compression: same as in encode.
+    Output: Image object like encode.
+    """
+    if isinstance(image, np.ndarray):
+        # A 2D array is a B/W image and must get that error below, not be mistaken for a flat buffer
+        if image.ndim not in (2, 3):
+            raise ValueError(f"Image array must have shape (height, width, chanels), got {image.shape}")
+        if image.ndim == 3 and chanels is not None and image.shape[2] != chanels:
+            raise ValueError(f"Image has {image.shape[2]} chanels, expected {chanels}")
+        if image.dtype != np.uint8:
+            raise ValueError(f"Image must be uint8, got {image.dtype}")
+    else:
+        if width is None or height is None or chanels is None:
+            raise ValueError("width, height and chanels are needed for a flat buffer")
+        image = np.frombuffer(image, dtype=np.uint8)
+        if len(image) != height * width * chanels:
+            raise ValueError(f"Buffer has {len(image)} bytes, expected {height * width * chanels}")
+        image = image.reshape(height, width, chanels)
+
+    if image.ndim == 2 or image.shape[2] == 1:
+        raise ValueError("QOI format does not support B/W images")
+
+    if image.shape[2] == 2:
+        raise ValueError("QOI format does not support grayscale images")
+
+    if order == "RGB":
+        image = image[:, :, [2, 1, 0, 3][: image.shape[2]]]
+    elif order != "BGR":
+        raise ValueError(f"Unknown chanel order {order}")
+
+    h = image.shape[0]
+    w = image.shape[1]
+    is_RGBA = image.shape[2] == 4
+
+    is_SRGB: bool = colorspace == "sRGB"
+    checkpoint_index = None
+
+    if compression is not None:
+        if strip_height is not None or checkpoint_rows is not None:
+            raise ValueError("Compression can not be combined with strips or checkpoints")
+
+        # Encode 64 rows at a time through the writer, so the uncompressed chunks are never all in memory
+        sink = io.BytesIO()
+        colorspace = "sRGB" if is_SRGB else "linear"
+        with QOIWriter(sink, w, h, 4 if is_RGBA else 3, colorspace, compression=compression) as writer:
+            writer.write_rows(image[y : y + 64] for y in range(0, h, 64))
+        output_bytes = bytearray(sink.getbuffer())
+    elif strip_height is not None:
+        output_bytes = encode_strips(image, strip_height, "sRGB" if is_SRGB else "linear")
+    else:
+        # Header
+        output_bytes: bytearray = encode_header(w, h, 4 if is_RGBA else 3, "sRGB" if is_SRGB else "linear")
+
+        if checkpoint_rows is not None:
+            data, checkpoint_index = encode_checkpoints(image, h, w, checkpoint_rows)
+        elif vectorized:
+            data = encode_vectorized(image, h, w)
+        elif is_RGBA:
+            data = encode_RGBA(image, h, w)
+        else:
+            data = encode_RGB(image, h, w)
+
+        output_bytes.extend(data)
+
+        # Ending mark
+        output_bytes.extend(END_MARK)
 
     class QOIImage:
         height = h
@@ -187,215 +1056,841 @@ def encode(img):
         colorspace = "sRGB" if is_SRGB else "linear"
         data = image
         binary = output_bytes
+        index = checkpoint_index
 
     return QOIImage
 
 
-def decode_RGB(data, height, width):
-    output_list = [[[0, 0, 0] for _ in range(width)] for _ in range(height)]
-    prev_pixel: list[int] = [0, 0, 0]
-    running_list: list[list[int]] = [[0, 0, 0] for _ in range(64)]
+def encode_to(out, image, **kwargs):
+    """
+    Encodes pixels that are in memory (see encode_array) straight into out.
 
-    byte_index = 0
-    run_length = 0
-    for h in range(height):
-        for w in range(width):
-            # pixel = [blue, green, red]
+    Arguments: out: file-like object with write() or a writable buffer (bytearray, memoryview, mmap, ...)
+                    that is big enough for the file (at most 14 + height * width * (chanels + 1) + 8 bytes),
+               image and kwargs: same as in encode_array.
+    Output: number of bytes written.
+    """
+    binary = encode_array(image, **kwargs).binary
 
-            # Run
-            if run_length > 0:
-                run_length -= 1
-                pixel = prev_pixel.copy()
-                output_list[h][w] = pixel.copy()
+    if hasattr(out, "write"):
+        out.write(binary)
+    else:
+        view = memoryview(out).cast("B")
+        if len(view) < len(binary):
+            raise ValueError(f"Output buffer has {len(view)} bytes, {len(binary)} are needed")
+        view[: len(binary)] = binary
 
-                color_hash = (pixel[2] * 3 + pixel[1] * 5 + pixel[0] * 7 + 255 * 11) % 64
-                running_list[color_hash] = pixel.copy()
-                continue
+    return len(binary)
 
-            # Unique
-            if data[byte_index] == 0b11111110:
-                pixel = [data[byte_index + i] for i in range(3, 0, -1)]
-                output_list[h][w] = pixel.copy()
 
-                color_hash = (pixel[2] * 3 + pixel[1] * 5 + pixel[0] * 7 + 255 * 11) % 64
-                running_list[color_hash] = pixel.copy()
-                prev_pixel = pixel.copy()
-                byte_index = byte_index + 4
-                continue
+def read_cv2(path):
+    import cv2
 
-            tag = data[byte_index] & 0b11000000
-            # Index
-            if tag == 0b00000000:
-                pixel = running_list[data[byte_index] & 0b00111111]
-                output_list[h][w] = pixel.copy()
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise OSError(f"Could not read {path}")
+    return image
 
-                prev_pixel = pixel.copy()
-                byte_index += 1
-                continue
 
-            # Diff
-            if tag == 0b01000000:
-                # pixel = [prev_pixel[i] + ((data[byte_index] >> (2 * i)) & 0b11) - 2 for i in range(0, 3)]
-                r = prev_pixel[2] + ((data[byte_index] >> 4) & 0b11) - 2
-                g = prev_pixel[1] + ((data[byte_index] >> 2) & 0b11) - 2
-                b = prev_pixel[0] + ((data[byte_index] >> 0) & 0b11) - 2
-                pixel = [b, g, r]
-                output_list[h][w] = pixel.copy()
-
-                color_hash = (pixel[2] * 3 + pixel[1] * 5 + pixel[0] * 7 + 255 * 11) % 64
-                running_list[color_hash] = pixel.copy()
-                prev_pixel = pixel.copy()
-                byte_index += 1
-                continue
+def read_pil(path):
+    """
+    Reads the image the same way as read_cv2: single band images (L, 1, I, F) are rejected like the 2D arrays
+    from cv2, palette images become RGB or RGBA (with transparency) and LA, CMYK, ... are converted to RGB(A).
+    """
+    from PIL import Image
 
-            # Luma
-            if tag == 0b10000000:
-                dg = (data[byte_index] & 0b00111111) - 32
+    with Image.open(path) as pil_image:
+        if len(pil_image.getbands()) == 1 and pil_image.mode != "P":
+            raise ValueError("QOI format does not support B/W images")
+        if pil_image.mode not in ("RGB", "RGBA"):
+            has_alpha = "A" in pil_image.getbands() or "transparency" in pil_image.info
+            pil_image = pil_image.convert("RGBA" if has_alpha else "RGB")
+        image = np.asarray(pil_image)
+    return np.ascontiguousarray(image[:, :, [2, 1, 0, 3][: image.shape[2]]])
 
-                byte_index += 1
 
-                drdg = ((data[byte_index] >> 4) & 0b00001111) - 8
-                dbdg = ((data[byte_index] >> 0) & 0b00001111) - 8
-                dr = drdg + dg
-                db = dbdg + dg
+def read_raw(path, width, height, chanels, order="BGR"):
+    image = np.fromfile(path, dtype=np.uint8).reshape(height, width, chanels)
+    if order == "RGB":
+        image = np.ascontiguousarray(image[:, :, [2, 1, 0, 3][:chanels]])
+    return image
 
-                pixel = [(prev_pixel[0] + db) & 0xFF, (prev_pixel[1] + dg) & 0xFF, (prev_pixel[2] + dr) & 0xFF]
-                output_list[h][w] = pixel.copy()
 
-                color_hash = (pixel[2] * 3 + pixel[1] * 5 + pixel[0] * 7 + 255 * 11) % 64
-                running_list[color_hash] = pixel.copy()
-                prev_pixel = pixel.copy()
-                byte_index += 1
-                continue
+def write_cv2(path, image):
+    import cv2
 
-            # RUN start
-            if tag == 0b11000000:
-                run_length = data[byte_index] & 0b00111111
-                pixel = prev_pixel.copy()
-                output_list[h][w] = pixel
+    if not cv2.imwrite(path, image):
+        raise OSError(f"Could not write {path}")
 
-                color_hash = (pixel[2] * 3 + pixel[1] * 5 + pixel[0] * 7 + 255 * 11) % 64
-                running_list[color_hash] = pixel.copy()
-                prev_pixel = pixel.copy()
-                byte_index += 1
-                continue
+
+def write_pil(path, image):
+    from PIL import Image
+
+    Image.fromarray(np.ascontiguousarray(image[:, :, [2, 1, 0, 3][: image.shape[2]]])).save(path)
+
+
+def write_raw(path, image):
+    np.ascontiguousarray(image).tofile(path)
+
+
+# Image file adapters. All of them work with [b, g, r] or [b, g, r, a] uint8 arrays.
+# The libraries are imported on the first use.
+IMAGE_READERS = {"cv2": read_cv2, "pil": read_pil, "raw": read_raw}
+IMAGE_WRITERS = {"cv2": write_cv2, "pil": write_pil, "raw": write_raw}
+
+
+def read_image(path, backend="cv2", **kwargs):
+    """
+    Arguments: path of the image, backend: "cv2", "pil" or "raw" (raw needs width, height and chanels).
+    Output: numpy array of shape (height, width, chanels) with pixels [b, g, r] or [b, g, r, a].
+    """
+    if backend not in IMAGE_READERS:
+        raise ValueError(f"Unknown backend {backend}, use one of {list(IMAGE_READERS)}")
+    return IMAGE_READERS[backend](path, **kwargs)
+
+
+def write_image(path, image, backend="cv2"):
+    """
+    Arguments: path of the image, image: [b, g, r] or [b, g, r, a] uint8 array, backend: "cv2", "pil" or "raw".
+    """
+    if backend not in IMAGE_WRITERS:
+        raise ValueError(f"Unknown backend {backend}, use one of {list(IMAGE_WRITERS)}")
+    IMAGE_WRITERS[backend](path, image)
+
+
+def encode(img, vectorized=True, strip_height=None, checkpoint_rows=None, compression=None, backend="cv2", **kwargs):
+    """
+    Arguments: File path to an image that is not in the QOI format and can be read by the backend.
+               vectorized: use encode_vectorized instead of the pixel by pixel encoders (same output).
+               strip_height: write the strip container (see encode_strips) instead of a plain QOI file.
+               checkpoint_rows: also make a checkpoint index for decode_rows (see encode_checkpoints).
+               compression: None, "zlib", "lzma" or "auto", compress the chunks and write a qoiz file (see QOIWriter).
+               backend and kwargs: how the file is read (see read_image).
+    Output: Image object:
+                height: the height of the image,
+                width: the width of the image,
+                chanels: "RGB" or "RGBA",
+                colorspace: "sRGB" or "linear",
+                data: the pixel data [b, g, r] or [b, g, r, a],
+                binary: the binary data for the QOI format,
+                index: the checkpoint index (None without checkpoint_rows). It is not written anywhere,
+                       save it next to the QOI file as <file>.qidx for decode_rows.
+    """
+    image = read_image(img, backend, **kwargs)
+
+    if len(image.shape) == 2:
+        raise ValueError("QOI format does not support B/W images")
+
+    is_SRGB: bool = False  # Typically false. TODO: Detection
+
+    return encode_array(
+        image,
+        colorspace="sRGB" if is_SRGB else "linear",
+        vectorized=vectorized,
+        strip_height=strip_height,
+        checkpoint_rows=checkpoint_rows,
+        compression=compression,
+    )
+
+
+def decode_rows_as_lists(data, height, width, chanels, stats=None):
+    """
+    Decodes row by row with decode_into and turns every row into lists [b, g, r] or [b, g, r, a].
+    Output: nested list output_list[y][x][chanel].
+    """
+    output_list = []
+    state = DecoderState(chanels)
+    row = bytearray(width * chanels)
+    byte_index = 0
+    for _ in range(height):
+        if stats is not None:
+            row_start, row_time = byte_index, time.perf_counter()
+        byte_index = decode_into(data, byte_index, row, 0, len(row), state)
+        output_list.append(np.frombuffer(row, dtype=np.uint8).reshape(width, chanels).tolist())
+        if stats is not None:
+            stats.add_row(data[row_start:byte_index], time.perf_counter() - row_time)
 
     return output_list
 
 
-def decode_RGBA(data, height, width):
-    output_list = [[[0, 0, 0, 0] for _ in range(width)] for _ in range(height)]
-    prev_pixel: list[int] = [0, 0, 0, 255]
-    running_list: list[list[int]] = [[0, 0, 0, 0] for _ in range(64)]
+def decode_RGB(data, height, width, stats=None):
+    return decode_rows_as_lists(data, height, width, 3, stats)
+
 
+def decode_RGBA(data, height, width, stats=None):
+    return decode_rows_as_lists(data, height, width, 4, stats)
+
+
+# Dispatch table: the chunk type of every first byte, with the types ordered by how often they appear in photos.
+OP_DIFF, OP_LUMA, OP_INDEX, OP_RGB, OP_RGBA, OP_RUN = range(6)
+OPCODES = [OP_INDEX] * 64 + [OP_DIFF] * 64 + [OP_LUMA] * 64 + [OP_RUN] * 62 + [OP_RGB, OP_RGBA]
+
+# Deltas of the first byte of QOI_OP_DIFF and of the second byte of QOI_OP_LUMA. The last item is how much the
+# color hash changes: the hash is linear and 256 is a multiple of 64, so it can be updated even when chanels wrap.
+DIFF_DELTAS = (
+    [None] * 64
+    + [
+        (dr, dg, db, dr * 3 + dg * 5 + db * 7)
+        for dr in range(-2, 2)
+        for dg in range(-2, 2)
+        for db in range(-2, 2)
+    ]
+    + [None] * 128
+)
+LUMA_DELTAS = [(drdg, dbdg, drdg * 3 + dbdg * 7) for drdg in range(-8, 8) for dbdg in range(-8, 8)]
+
+
+class DecoderState:
+    """
+    Decoder state that is carried from one chunk of pixels to the next one.
+        pixel: the last decoded pixel (b, g, r, a),
+        running_list: the 64 running list entries as four lists of chanels [b], [g], [r], [a],
+        run: how many pixels of the current run are still to be written.
+    """
+
+    def __init__(self, chanels):
+        self.chanels = chanels
+        self.pixel = (0, 0, 0, 255)
+        # RGB images are hashed with alpha 255, so the running list starts with it as well.
+        self.running_list = ([0] * 64, [0] * 64, [0] * 64, [255 if chanels == 3 else 0] * 64)
+        self.run = 0
+
+
+def decode_into(data, byte_index, output, start, end, state):
+    """
+    Decodes pixels into output[start:end] and updates the state.
+
+    Arguments: data (QOI chunks), byte_index of the first chunk in data, output: writable byte buffer,
+               start and end byte offsets in output, state: DecoderState.
+    Output: byte index of the first chunk that was not used.
+    """
+    chanels = state.chanels
+    # Pixels and running list entries are kept as separate chanels. Chanels are small ints that Python caches,
+    # so decoding a pixel allocates nothing, and the chunk deltas come precomputed from the tables.
+    b, g, r, a = state.pixel
+    running_b, running_g, running_r, running_a = state.running_list
+    opcodes = OPCODES
+    diff_deltas = DIFF_DELTAS
+    luma_deltas = LUMA_DELTAS
+    color_hash = (r * 3 + g * 5 + b * 7 + a * 11) % 64
+
+    o = start
+
+    # Rest of the run from the previous chunk
+    if state.run > 0:
+        run_length = min(state.run, (end - o) // chanels)
+        output[o : o + run_length * chanels] = bytes((b, g, r, a)[:chanels]) * run_length
+        state.run -= run_length
+        o += run_length * chanels
+
+    while o < end:
+        byte = data[byte_index]
+        op = opcodes[byte]
+
+        # Diff
+        if op == OP_DIFF:
+            dr, dg, db, dh = diff_deltas[byte]
+            r = (r + dr) & 0xFF
+            g = (g + dg) & 0xFF
+            b = (b + db) & 0xFF
+            color_hash = (color_hash + dh) & 0b00111111
+            byte_index += 1
+
+        # Luma
+        elif op == OP_LUMA:
+            dg = byte - 0b10100000  # (byte & 0b00111111) - 32
+            drdg, dbdg, dh = luma_deltas[data[byte_index + 1]]
+            r = (r + dg + drdg) & 0xFF
+            g = (g + dg) & 0xFF
+            b = (b + dg + dbdg) & 0xFF
+            color_hash = (color_hash + dg * 15 + dh) & 0b00111111
+            byte_index += 2
+
+        # Index
+        elif op == OP_INDEX:
+            b = running_b[byte]
+            g = running_g[byte]
+            r = running_r[byte]
+            a = running_a[byte]
+            color_hash = (r * 3 + g * 5 + b * 7 + a * 11) % 64
+            byte_index += 1
+
+        # Unique
+        elif op == OP_RGB:
+            r, g, b = data[byte_index + 1], data[byte_index + 2], data[byte_index + 3]
+            color_hash = (r * 3 + g * 5 + b * 7 + a * 11) % 64
+            byte_index += 4
+        elif op == OP_RGBA:
+            r, g, b = data[byte_index + 1], data[byte_index + 2], data[byte_index + 3]
+            a = data[byte_index + 4]
+            color_hash = (r * 3 + g * 5 + b * 7 + a * 11) % 64
+            byte_index += 5
+
+        # Run, written in one go. What does not fit is left for the next chunk.
+        else:
+            run_length = byte - 0b10111111  # (byte & 0b00111111) + 1
+            written = min(run_length, (end - o) // chanels)
+            output[o : o + written * chanels] = bytes((b, g, r, a)[:chanels]) * written
+            running_b[color_hash] = b
+            running_g[color_hash] = g
+            running_r[color_hash] = r
+            running_a[color_hash] = a
+            state.run = run_length - written
+            o += written * chanels
+            byte_index += 1
+            continue
+
+        running_b[color_hash] = b
+        running_g[color_hash] = g
+        running_r[color_hash] = r
+        running_a[color_hash] = a
+        output[o] = b
+        output[o + 1] = g
+        output[o + 2] = r
+        if chanels == 4:
+            output[o + 3] = a
+        o += chanels
+
+    state.pixel = (b, g, r, a)
+    return byte_index
+
+
+def decode_array(data, height, width, chanels, out=None, byte_index=0):
+    """
+    Decodes the QOI chunks straight into one preallocated uint8 buffer instead of nested lists.
+
+    Arguments: data (QOI chunks without header and ending mark), height and width of the image,
+               chanels: 3 or 4,
+               out: optional writable C-contiguous buffer (bytearray, numpy array, ...) to decode into,
+               byte_index: where the chunks start in data.
+    Output: numpy array of shape (height, width, chanels) with pixels [b, g, r] or [b, g, r, a].
+    """
+    size = height * width * chanels
+    if out is None:
+        output = bytearray(size)
+    else:
+        output = memoryview(out).cast("B")
+        if output.readonly or len(output) < size:
+            raise ValueError(f"Output buffer must be writable and at least {size} bytes long")
+
+    decode_into(data, byte_index, output, 0, size, DecoderState(chanels))
+    return np.frombuffer(output, dtype=np.uint8, count=size).reshape(height, width, chanels)
+
+
+def decode_header(header):
+    """
+    Arguments: the first 14 bytes of a QOI file.
+    Output: (width, height, chanels, colorspace)
+    """
+    if len(header) < 14 or header[0:4] != "qoif".encode("ascii"):
+        raise ValueError("Not qoif file.")
+
+    w = int.from_bytes(header[4:8], "big")
+    h = int.from_bytes(header[8:12], "big")
+    chanels = 4 if header[12] == 4 else 3
+    colorspace = "sRGB" if header[13] == 0 else "linear"
+    return w, h, chanels, colorspace
+
+
+def decode_stream(stream, block_size=1 << 16):
+    """
+    Decodes a QOI file from any binary stream (file, socket.makefile("rb"), ...) row by row.
+    The stream is read in blocks of at most block_size bytes, so only one block and one row are held in memory.
+    With read1 a row is decoded as soon as its bytes have arrived, without waiting for a whole block.
+    qoiz files are decompressed on the fly (see DecompressedStream).
+
+    Arguments: stream: binary file-like object positioned at the start of a QOI file,
+               block_size: number of bytes read at once.
+    Output: generator that first yields (width, height, chanels, colorspace) and then every row
+            as a numpy array of shape (width, chanels).
+    """
+    header = bytearray()
+    while len(header) < 14:
+        block = stream.read(14 - len(header))
+        if not block:
+            break
+        header.extend(block)
+    if header[0:4] == "qoiz".encode("ascii"):
+        method = stream.read(1)
+        if not method or method[0] >= len(COMPRESSION_METHODS):
+            raise ValueError("Not qoiz file.")
+        stream = DecompressedStream(stream, COMPRESSION_METHODS[method[0]], block_size)
+        header[0:4] = "qoif".encode("ascii")
+    w, h, chanels, colorspace = decode_header(header)
+    yield w, h, chanels, colorspace
+
+    state = DecoderState(chanels)
+    buffer = bytearray()
     byte_index = 0
-    run_length = 0
-    for h in range(height):
-        for w in range(width):
-            # pixel = [blue, green, red]
+    is_eof = False
+    max_row_bytes = w * 5  # A pixel takes at most 5 bytes (QOI_OP_RGBA)
+    row_bytes = w * chanels
+
+    for _ in range(h):
+        # Keep enough bytes for a whole row, so no chunk is split between two blocks
+        while len(buffer) - byte_index < max_row_bytes and not is_eof:
+            block = read_some(stream, block_size)
+            if not block:
+                is_eof = True
+                break
+            del buffer[:byte_index]
+            byte_index = 0
+            buffer.extend(block)
+
+        row = bytearray(row_bytes)
+        try:
+            byte_index = decode_into(buffer, byte_index, row, 0, row_bytes, state)
+        except IndexError:
+            raise ValueError("QOI file ends before all pixels were decoded.")
+        yield np.frombuffer(row, dtype=np.uint8).reshape(w, chanels)
 
-            # Run
-            if run_length > 0:
-                run_length -= 1
-                pixel = prev_pixel.copy()
-                output_list[h][w] = pixel.copy()
+    # Ending mark
+    end = bytearray(buffer[byte_index:])
+    while len(end) < 8:
+        block = stream.read(8 - len(end))
+        if not block:
+            break
+        end.extend(block)
+    if end[:8] != END_MARK:
+        raise ValueError("Not qoif file.")
 
-                color_hash = (pixel[2] * 3 + pixel[1] * 5 + pixel[0] * 7 + pixel[3] * 11) % 64
-                running_list[color_hash] = pixel.copy()
-                continue
 
-            # Unique
-            if data[byte_index] == 0b11111111:
-                r = data[byte_index + 1]
-                g = data[byte_index + 2]
-                b = data[byte_index + 3]
-                a = data[byte_index + 4]
-                pixel = [b, g, r, a]
-                output_list[h][w] = pixel.copy()
-
-                color_hash = (pixel[2] * 3 + pixel[1] * 5 + pixel[0] * 7 + pixel[3] * 11) % 64
-                running_list[color_hash] = pixel.copy()
-                prev_pixel = pixel.copy()
-                byte_index = byte_index + 5
-                continue
+def decode_mmap(img, out=None):
+    """
+    Decodes a QOI file by memory mapping it. The header and chunks are read straight from the mapped
+    pages, so the file is never copied into a bytes object.
 
-            tag = data[byte_index] & 0b11000000
-            # Index
-            if tag == 0b00000000:
-                pixel = running_list[data[byte_index] & 0b00111111]
-                output_list[h][w] = pixel.copy()
+    A strip container (qoit) is decoded with decode_strips and a compressed qoiz file is decompressed
+    into memory first (decompress_file), so those are not mapped.
 
-                prev_pixel = pixel.copy()
-                byte_index += 1
-                continue
+    Arguments: File path to an image that is in the QOI format (or the strip container, or compressed qoiz),
+               out: optional writable C-contiguous buffer with at least height * width * chanels bytes.
+    Output: Image object like decode, without binary (the mapping is closed after decoding).
+    """
+    with open(img, "rb") as f:
+        if os.fstat(f.fileno()).st_size < 14 + 8:
+            raise ValueError("Not qoif file.")
+        magic = f.read(4)
+
+        if magic == "qoit".encode("ascii"):
+            image_data, cs = decode_strips(img)
+            h, w, c = image_data.shape
+            if out is not None:
+                output = np.frombuffer(out, dtype=np.uint8, count=image_data.size).reshape(h, w, c)
+                output[...] = image_data
+                image_data = output
+        elif magic == "qoiz".encode("ascii"):
+            f.seek(0)
+            file = decompress_file(f.read())
+            w, h, c, cs = decode_header(file[0:14])
+            image_data = decode_array(file, h, w, c, out, byte_index=14)
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    w, h, c, cs = decode_header(view[0:14])
+                    if view[-8:] != END_MARK:
+                        raise ValueError("Not qoif file.")
 
-            # Diff
-            if tag == 0b01000000:
-                # pixel = [prev_pixel[i] + ((data[byte_index] >> (2 * i)) & 0b11) - 2 for i in range(0, 3)]
-                r = prev_pixel[2] + ((data[byte_index] >> 4) & 0b11) - 2
-                g = prev_pixel[1] + ((data[byte_index] >> 2) & 0b11) - 2
-                b = prev_pixel[0] + ((data[byte_index] >> 0) & 0b11) - 2
-                a = prev_pixel[3]
-                pixel = [b, g, r, a]
-                output_list[h][w] = pixel.copy()
-
-                color_hash = (pixel[2] * 3 + pixel[1] * 5 + pixel[0] * 7 + pixel[3] * 11) % 64
-                running_list[color_hash] = pixel.copy()
-                prev_pixel = pixel.copy()
-                byte_index += 1
-                continue
+                    image_data = decode_array(view, h, w, c, out, byte_index=14)
+                finally:
+                    view.release()
 
-            # Luma
-            if tag == 0b10000000:
-                dg = (data[byte_index] & 0b00111111) - 32
+    class QOIImage:
+        height = h
+        width = w
+        chanels = "RGBA" if c == 4 else "RGB"
+        colorspace = cs
+        data = image_data
+        binary = None
 
-                byte_index += 1
+    return QOIImage
 
-                drdg = ((data[byte_index] >> 4) & 0b00001111) - 8
-                dbdg = ((data[byte_index] >> 0) & 0b00001111) - 8
-                dr = drdg + dg
-                db = dbdg + dg
 
-                a = prev_pixel[3]
+def decode_strip(task):
+    """
+    Decodes one strip of the strip container. Used by decode_strips in the worker processes.
 
-                pixel = [(prev_pixel[0] + db) & 0xFF, (prev_pixel[1] + dg) & 0xFF, (prev_pixel[2] + dr) & 0xFF, a]
-                output_list[h][w] = pixel.copy()
+    Arguments: task = (file path, start offset, end offset, rows, width, chanels)
+    Output: numpy array of shape (rows, width, chanels)
+    """
+    path, start, end, rows, width, chanels = task
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return decode_array(data, rows, width, chanels)
 
-                color_hash = (pixel[2] * 3 + pixel[1] * 5 + pixel[0] * 7 + pixel[3] * 11) % 64
-                running_list[color_hash] = pixel.copy()
-                prev_pixel = pixel.copy()
-                byte_index += 1
-                continue
 
-            # RUN start
-            if tag == 0b11000000:
-                run_length = data[byte_index] & 0b00111111
-                pixel = prev_pixel.copy()
-                output_list[h][w] = pixel
+def decode_strips(img, y0=0, y1=None, workers=1):
+    """
+    Decodes rows y0 to y1 of a strip container file (see encode_strips). Only the strips that contain
+    these rows are read and decoded, so a row range never needs the rows before it.
 
-                color_hash = (pixel[2] * 3 + pixel[1] * 5 + pixel[0] * 7 + pixel[3] * 11) % 64
-                running_list[color_hash] = pixel.copy()
-                prev_pixel = pixel.copy()
-                byte_index += 1
-                continue
+    Arguments: File path to a strip container, y0 and y1: the row range (y1 = None means to the end),
+               workers: number of processes used for decoding.
+    Output: (numpy array of shape (y1 - y0, width, chanels), colorspace)
+    """
+    with open(img, "rb") as f:
+        header = f.read(22)
+        if len(header) < 22 or header[0:4] != "qoit".encode("ascii"):
+            raise ValueError("Not qoit file.")
+
+        w, h, chanels, colorspace = decode_header("qoif".encode("ascii") + header[4:14])
+        strip_height = int.from_bytes(header[14:18], "big")
+        strip_count = int.from_bytes(header[18:22], "big")
+        table = f.read((strip_count + 1) * 8)
+        offsets = [int.from_bytes(table[i : i + 8], "big") for i in range(0, len(table), 8)]
+
+    y1 = h if y1 is None else min(y1, h)
+    if not 0 <= y0 <= y1:
+        raise ValueError(f"Invalid row range {y0}:{y1}")
+
+    first = y0 // strip_height
+    last = (y1 - 1) // strip_height + 1 if y1 > y0 else first
+    tasks = []
+    for i in range(first, last):
+        rows = min(strip_height, h - i * strip_height)
+        tasks.append((img, offsets[i], offsets[i + 1], rows, w, chanels))
+
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            strips = list(executor.map(decode_strip, tasks))
+    else:
+        strips = [decode_strip(task) for task in tasks]
 
-    return output_list
+    if not strips:
+        return np.zeros((0, w, chanels), dtype=np.uint8), colorspace
+
+    image_data = np.concatenate(strips)
+    skip = y0 - first * strip_height
+    return image_data[skip : skip + y1 - y0], colorspace
+
+
+def decode_rows(img, y0=0, y1=None, index=None):
+    """
+    Decodes rows y0 to y1 of a QOI file. With a checkpoint index (see encode_checkpoints) decoding starts
+    at the last checkpoint before y0, so the work depends on the size of the crop and not of the image.
+
+    Arguments: File path to an image that is in the QOI format, y0 and y1: the row range (y1 = None means
+               to the end), index: path to the checkpoint index (default <img>.qidx, decodes from the start
+               if it does not exist or was made for a file of another size, for example an older encoding).
+    Output: numpy array of shape (y1 - y0, width, chanels)
+    """
+    index = img + ".qidx" if index is None else index
+    checkpoints = np.zeros(0, dtype=CHECKPOINT_DTYPE)
+    if os.path.exists(index):
+        with open(index, "rb") as f:
+            index_data = f.read()
+        if index_data[0:4] != "qidx".encode("ascii"):
+            raise ValueError("Not qidx file.")
+        count = int.from_bytes(index_data[8:12], "big")
+        file_size = int.from_bytes(index_data[12:20], "big")
+        # A stale index (the image was encoded again) would seek to wrong offsets, so it is not used
+        if len(index_data) == 20 + count * CHECKPOINT_DTYPE.itemsize and file_size == os.path.getsize(img):
+            checkpoints = np.frombuffer(index_data, dtype=CHECKPOINT_DTYPE, offset=20)
+
+    with open(img, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        view = memoryview(mapped)
+        try:
+            w, h, chanels, _ = decode_header(view[0:14])
+            y1 = h if y1 is None else min(y1, h)
+            if not 0 <= y0 <= y1:
+                raise ValueError(f"Invalid row range {y0}:{y1}")
+
+            state = DecoderState(chanels)
+            start_row = 0
+            byte_index = 14
+            usable = checkpoints[checkpoints["row"] <= y0]
+            if len(usable) > 0:
+                checkpoint = usable[-1]
+                start_row = int(checkpoint["row"])
+                byte_index = int(checkpoint["offset"])
+                state.pixel = tuple(int(chanel) for chanel in checkpoint["pixel"])
+                packed = [int(p) for p in checkpoint["running_list"]]
+                state.running_list = (
+                    [p & 0xFF for p in packed],
+                    [(p >> 8) & 0xFF for p in packed],
+                    [(p >> 16) & 0xFF for p in packed],
+                    [p >> 24 if chanels == 4 else 255 for p in packed],
+                )
+                # Skip the part of the run that belongs to the rows before the checkpoint
+                if checkpoint["run"] > 0:
+                    state.run = (view[byte_index] & 0b00111111) + 1 - int(checkpoint["run"])
+                    byte_index += 1
+
+            output = bytearray((y1 - start_row) * w * chanels)
+            decode_into(view, byte_index, output, 0, len(output), state)
+        finally:
+            view.release()
+
+    image_data = np.frombuffer(output, dtype=np.uint8).reshape(y1 - start_row, w, chanels)
+    return image_data[y0 - start_row :]
+
+
+def decode_shared(img):
+    """
+    Decodes a QOI file (or strip container, or qoiz) straight into a new multiprocessing shared memory block,
+    so other processes can attach to the decoded pixels without decoding or copying them (see attach_shared).
+
+    Arguments: File path to an image.
+    Output: (SharedMemory, numpy array of shape (height, width, chanels) on top of it, colorspace).
+            The array has to be deleted before the block is closed. The caller unlinks the block when done.
+    """
+    from multiprocessing.shared_memory import SharedMemory
+
+    with open(img, "rb") as f:
+        file = f.read()
+
+    if file[0:4] == "qoit".encode("ascii"):
+        image_data, cs = decode_strips(img)
+        shm = SharedMemory(create=True, size=max(image_data.nbytes, 1))
+        shared = np.ndarray(image_data.shape, dtype=np.uint8, buffer=shm.buf)
+        shared[:] = image_data
+        return shm, shared, cs
+
+    if file[0:4] == "qoiz".encode("ascii"):
+        file = decompress_file(file)
+
+    w, h, c, cs = decode_header(file[0:14])
+    if file[-8:] != END_MARK:
+        raise ValueError("Not qoif file.")
+
+    shm = SharedMemory(create=True, size=max(h * w * c, 1))
+    try:
+        image_data = decode_array(file, h, w, c, out=shm.buf, byte_index=14)
+    except Exception:
+        shm.close()
+        shm.unlink()
+        raise
+    return shm, image_data, cs
+
+
+def attach_shared(descriptor):
+    """
+    Arguments: descriptor (name, shape, colorspace) of a decoded image, as returned by SharedImageCache.get.
+    Output: (SharedMemory, read only numpy array on top of it, colorspace). Delete the array, then close the block;
+            the process that decoded the image unlinks it.
+    """
+    from multiprocessing.shared_memory import SharedMemory
+
+    name, shape, colorspace = descriptor
+    try:
+        shm = SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 has no track, the block is then tracked like in the creating process
+        shm = SharedMemory(name=name)
+    image_data = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    image_data.flags.writeable = False
+    return shm, image_data, colorspace
+
+
+class SharedImageCache:
+    """
+    LRU cache of images decoded into shared memory. The process that serves the images owns the cache and hands
+    descriptors to its workers, which attach to the decoded pixels with attach_shared instead of decoding them again.
+    Entries are keyed by path and are decoded again when the mtime or size of the file changes. The least recently
+    used images are unlinked when the decoded images take more than budget bytes (the newest image always stays).
+    Unlinked blocks stay valid in processes that are already attached to them.
+
+    Usage:
+        with SharedImageCache(budget=256 << 20) as cache:
+            executor.submit(worker, cache.get("images/kodim01.qoi"))
+    """
+
+    def __init__(self, budget=256 << 20):
+        self.budget = budget
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        # path -> (mtime_ns, size, SharedMemory, descriptor)
+        self.entries = OrderedDict()
+
+    def get(self, img):
+        """
+        Arguments: File path to an image (see decode_shared).
+        Output: descriptor (name, shape, colorspace) for attach_shared.
+        """
+        path = os.path.abspath(img)
+        stat = os.stat(path)
+        entry = self.entries.get(path)
+        if entry is not None and entry[0:2] == (stat.st_mtime_ns, stat.st_size):
+            self.hits += 1
+            self.entries.move_to_end(path)
+            return entry[3]
+
+        self.misses += 1
+        if entry is not None:
+            self.remove(path)
+
+        shm, image_data, colorspace = decode_shared(path)
+        descriptor = (shm.name, image_data.shape, colorspace)
+        self.used += image_data.nbytes
+        del image_data
+        self.entries[path] = (stat.st_mtime_ns, stat.st_size, shm, descriptor)
+
+        while self.used > self.budget and len(self.entries) > 1:
+            self.remove(next(iter(self.entries)))
+        return descriptor
+
+    def remove(self, path):
+        _, _, shm, descriptor = self.entries.pop(path)
+        self.used -= int(np.prod(descriptor[1]))
+        shm.close()
+        shm.unlink()
+
+    def close(self):
+        while self.entries:
+            self.remove(next(iter(self.entries)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_sequence_index(f):
+    """
+    Arguments: binary file positioned at the start of a sequence container (see encode_sequence).
+    Output: (width, height, chanels, colorspace, frame types, n + 1 frame offsets)
+    """
+    header = f.read(18)
+    if len(header) < 18 or header[0:4] != "qois".encode("ascii"):
+        raise ValueError("Not qois file.")
+
+    w, h, chanels, colorspace = decode_header("qoif".encode("ascii") + header[4:14])
+    frame_count = int.from_bytes(header[14:18], "big")
+    types = f.read(frame_count)
+    table = f.read((frame_count + 1) * 8)
+    offsets = [int.from_bytes(table[i : i + 8], "big") for i in range(0, len(table), 8)]
+    return w, h, chanels, colorspace, types, offsets
+
+
+def decode_inter_frame(data, prev_frame):
+    """
+    Arguments: data (one inter frame, see encode_inter_frame), prev_frame: the decoded previous frame.
+    Output: numpy array with the same shape as prev_frame.
+    """
+    h, w, chanels = prev_frame.shape
+    span_count = int.from_bytes(data[0:4], "big")
+    spans = np.frombuffer(data, dtype=">u4", count=span_count, offset=4).astype(np.int64)
+    changed = np.repeat(np.arange(span_count) % 2 == 1, spans)
+
+    frame = prev_frame.copy()
+    changed_count = int(spans[1::2].sum())
+    changed_pixels = decode_array(data, 1, changed_count, chanels, byte_index=4 + 4 * span_count)
+    frame.reshape(h * w, chanels)[changed] = changed_pixels[0]
+    return frame
+
+
+def decode_sequence(img, start=0, stop=None):
+    """
+    Decodes frames start to stop of a sequence container. Decoding starts at the last key frame before start,
+    so a frame in the middle of the sequence only needs the frames since that key frame.
+
+    Arguments: File path to a sequence container, start and stop: the frame range (stop = None means to the end).
+    Output: generator of numpy arrays of shape (height, width, chanels).
+    """
+    with open(img, "rb") as f:
+        w, h, chanels, _, types, offsets = read_sequence_index(f)
+
+        stop = len(types) if stop is None else stop
+        if not 0 <= start <= stop or start >= len(types) and stop > start:
+            raise ValueError(f"Invalid frame range {start}:{stop} of {len(types)} frames")
+        stop = min(stop, len(types))
+        if start == stop:
+            return
+
+        first = start
+        while first > 0 and types[first] != KEY_FRAME:
+            first -= 1
+
+        frame = None
+        for i in range(first, stop):
+            f.seek(offsets[i])
+            data = f.read(offsets[i + 1] - offsets[i])
+            if types[i] == KEY_FRAME:
+                frame = decode_array(data, h, w, chanels)
+            else:
+                frame = decode_inter_frame(data, frame)
+            if i >= start:
+                yield frame
+
+
+def decode_frame(img, index):
+    """
+    Arguments: File path to a sequence container, index of the frame.
+    Output: numpy array of shape (height, width, chanels).
+    """
+    with open(img, "rb") as f:
+        frame_count = len(read_sequence_index(f)[4])
+    if not 0 <= index < frame_count:
+        raise IndexError(f"Frame {index} is out of range")
+    return next(decode_sequence(img, index, index + 1))
 
 
-def decode(img):
+def find_chunk(data, pixel_index):
+    """
+    Arguments: data (QOI chunks without header and ending mark), pixel_index (y * width + x).
+    Output: (byte offset, chunk name) of the chunk that produced the pixel, or None if the data is shorter.
     """
-    Arguments: File path to an image that is in the QOI format and can be read by cv2.
+    pixels = 0
+    byte_index = 0
+    while byte_index < len(data):
+        byte = data[byte_index]
+        if byte == 0b11111110:
+            name, size, count = "QOI_OP_RGB", 4, 1
+        elif byte == 0b11111111:
+            name, size, count = "QOI_OP_RGBA", 5, 1
+        elif byte < 0b01000000:
+            name, size, count = "QOI_OP_INDEX", 1, 1
+        elif byte < 0b10000000:
+            name, size, count = "QOI_OP_DIFF", 1, 1
+        elif byte < 0b11000000:
+            name, size, count = "QOI_OP_LUMA", 2, 1
+        else:
+            name, size, count = "QOI_OP_RUN", 1, (byte & 0b00111111) + 1
+
+        pixels += count
+        if pixel_index < pixels:
+            return byte_index, name
+        byte_index += size
+
+    return None
+
+
+def decode(img, as_list=False):
+    """
+    Arguments: File path to an image that is in the QOI format (or the strip container, or compressed qoiz).
+               as_list: return the pixel data as nested lists (decode_RGB / decode_RGBA) instead of a numpy array.
     Output: Image object:
                 height: the height of the image,
                 width: the width of the image,
                 chanels: "RGB" or "RGBA",
                 colorspace: "sRGB" or "linear",
-                data: the pixel data [b, g, r] or [b, g, r, a],
+                data: the pixel data [b, g, r] or [b, g, r, a] as a uint8 numpy array of shape (height, width, chanels),
                 binary: the binary data for the QOI format.
     """
     with open(img, "rb") as f:
         file = f.read()
 
+        if file[0:4] == "qoit".encode("ascii"):
+            image_data, cs = decode_strips(img)
+
+            class QOIImage:
+                height = image_data.shape[0]
+                width = image_data.shape[1]
+                chanels = "RGBA" if image_data.shape[2] == 4 else "RGB"
+                colorspace = cs
+                data = image_data
+                binary = file
+
+            return QOIImage
+
+        if file[0:4] == "qoiz".encode("ascii"):
+            file = decompress_file(file)
+
         header = file[0:14]
         data = file[14:-8]
         end = file[-8:]
@@ -403,7 +1898,7 @@ def decode(img):
         if header[0:4] != "qoif".encode("ascii"):
             raise ValueError("Not qoif file.")
 
-        if end != b"\x00\x00\x00\x00\x00\x00\x00\x01":
+        if end != END_MARK:
             raise ValueError("Not qoif file.")
 
         w = int.from_bytes(header[4:8], "big")
@@ -411,7 +1906,9 @@ def decode(img):
         is_RGBA = header[12] == 4
         is_SRGB = header[13] == 0
 
-        if is_RGBA:
+        if not as_list:
+            image_data = decode_array(data, h, w, 4 if is_RGBA else 3)
+        elif is_RGBA:
             image_data = decode_RGBA(data, h, w)
         else:
             image_data = decode_RGB(data, h, w)
@@ -425,3 +1922,105 @@ def decode(img):
             binary = file
 
     return QOIImage
+
+
+def convert_file(task):
+    """
+    Encodes or decodes one file. Used by convert_tree in the worker processes.
+
+    Arguments: task = (mode, source path, destination path, backend), mode is "encode" or "decode",
+                      backend is used for reading or writing the image (see read_image).
+    Output: (source, destination, seconds, size of the raw pixels, size of the QOI file)
+    """
+    mode, src, dst, backend = task
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+
+    start = time.perf_counter()
+    if mode == "encode":
+        image = encode(src, backend=backend)
+        with open(dst, "wb") as f:
+            f.write(image.binary)
+        qoi_size = len(image.binary)
+    else:
+        image = decode_mmap(src)
+        write_image(dst, image.data, backend)
+        qoi_size = os.path.getsize(src)
+    seconds = time.perf_counter() - start
+
+    raw_size = image.height * image.width * len(image.chanels)
+    return src, dst, seconds, raw_size, qoi_size
+
+
+def find_files(mode, src, dst, backend="cv2"):
+    """
+    Arguments: mode: "encode" or "decode", src: source directory, dst: destination directory,
+               backend: used for reading or writing the images (see read_image).
+    Output: list of tasks for convert_file, the directory tree of src is kept in dst.
+    """
+    extensions = ["." + ext for ext in SUPPORTED_FILE_TYPES] if mode == "encode" else [".qoi"]
+    new_extension = ".qoi" if mode == "encode" else ".png"
+
+    tasks = []
+    for root, _, files in os.walk(src):
+        for file in sorted(files):
+            name, extension = os.path.splitext(file)
+            if extension.lower() not in extensions:
+                continue
+            relative = os.path.relpath(os.path.join(root, name), src)
+            tasks.append((mode, os.path.join(root, file), os.path.join(dst, relative + new_extension), backend))
+    return tasks
+
+
+def convert_tree(mode, src, dst, workers=None, ordered=True, backend="cv2"):
+    """
+    Encodes or decodes all images in a directory tree over a process pool.
+
+    Arguments: mode: "encode" or "decode", src: source directory, dst: destination directory,
+               workers: number of processes (default: number of cores),
+               ordered: yield the results in the order of the files, otherwise as they are finished,
+               backend: used for reading or writing the images (see read_image).
+    Output: generator of convert_file results.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    tasks = find_files(mode, src, dst, backend)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if ordered:
+            yield from executor.map(convert_file, tasks)
+        else:
+            for future in as_completed([executor.submit(convert_file, task) for task in tasks]):
+                yield future.result()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m my_qoi", description="Batch QOI encoder/decoder.")
+    parser.add_argument("mode", choices=["encode", "decode"])
+    parser.add_argument("src", help="source directory")
+    parser.add_argument("dst", help="destination directory")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--unordered", action="store_true", help="print the results as soon as they are finished")
+    parser.add_argument("--backend", choices=["cv2", "pil"], default="cv2", help="library for reading/writing images")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.src):
+        raise OSError(f"Input directory does not exist: {args.src}")
+
+    start = time.perf_counter()
+    total_raw = 0
+    total_qoi = 0
+    count = 0
+    results = convert_tree(args.mode, args.src, args.dst, args.workers, not args.unordered, args.backend)
+    for src, dst, seconds, raw_size, qoi_size in results:
+        print(f"{src} -> {dst}: {seconds:.3f} s, {raw_size} B raw, {qoi_size} B qoi, ratio {raw_size / qoi_size:.2f}")
+        total_raw += raw_size
+        total_qoi += qoi_size
+        count += 1
+
+    if count > 0:
+        print(f"{count} files in {time.perf_counter() - start:.3f} s, ratio {total_raw / total_qoi:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import my_qoi
+
+# asyncio variants of my_qoi for servers. All blocking work (reading files, decoding PNG, the codec itself)
+# runs in a bounded executor, one chunk of rows at a time. The streaming functions are async generators,
+# so the next chunk is only encoded when the consumer asks for it (backpressure), and cancelling the consumer
+# stops the work after the chunk that is running.
+
+_executor = None
+
+
+def get_executor():
+    """
+    Output: the shared thread pool (one worker per core) used when no executor is given.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="qoi")
+    return _executor
+
+
+class ChunkSink:
+    """
+    Sink for QOIWriter that keeps the written chunks until they are taken.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+async def encode_chunks(img, chunk_rows=64, colorspace="linear", compression=None, backend="cv2", executor=None):
+    """
+    Encodes an image and yields the QOI file in pieces as they are produced (for chunked HTTP responses).
+
+    Arguments: img: file path (read with the backend) or a cv2 ndarray [b, g, r] or [b, g, r, a],
+               chunk_rows: rows encoded per executor call, colorspace: "sRGB" or "linear",
+               compression: None, "zlib", "lzma" or "auto" (see my_qoi.QOIWriter),
+               backend: how the file is read (see my_qoi.read_image), executor: default get_executor().
+    Output: async generator of bytes.
+    """
+    loop = asyncio.get_running_loop()
+    executor = executor or get_executor()
+
+    image = img
+    if not isinstance(img, np.ndarray):
+        image = await loop.run_in_executor(executor, my_qoi.read_image, img, backend)
+    if image.ndim != 3 or image.shape[2] not in (3, 4):
+        raise ValueError("QOI format supports only 3 or 4 chanels")
+
+    h, w, chanels = image.shape
+    sink = ChunkSink()
+    writer = my_qoi.QOIWriter(sink, w, h, chanels, colorspace, compression=compression)
+    for y in range(0, h, chunk_rows):
+        await loop.run_in_executor(executor, writer.write, image[y : y + chunk_rows])
+        data = sink.take()
+        if data:
+            yield data
+
+    await loop.run_in_executor(executor, writer.close)
+    yield sink.take()
+
+
+async def encode_async(img, **kwargs):
+    """
+    Arguments: same as encode_chunks.
+    Output: bytearray with the whole QOI file.
+    """
+    output_bytes = bytearray()
+    async for data in encode_chunks(img, **kwargs):
+        output_bytes.extend(data)
+    return output_bytes
+
+
+async def decode_rows_async(img, chunk_rows=64, executor=None):
+    """
+    Decodes a QOI (or qoiz) file chunk by chunk with my_qoi.decode_stream.
+
+    Arguments: img: file path, chunk_rows: rows decoded per executor call, executor: default get_executor().
+    Output: async generator that first yields (width, height, chanels, colorspace) and then numpy arrays
+            of up to chunk_rows rows.
+    """
+    loop = asyncio.get_running_loop()
+    executor = executor or get_executor()
+
+    f = await loop.run_in_executor(executor, open, img, "rb")
+    try:
+        rows = my_qoi.decode_stream(f)
+        header = await loop.run_in_executor(executor, next, rows)
+        yield header
+
+        def next_chunk():
+            chunk = [row for _, row in zip(range(chunk_rows), rows)]
+            return np.stack(chunk) if chunk else None
+
+        while True:
+            chunk = await loop.run_in_executor(executor, next_chunk)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        await loop.run_in_executor(executor, f.close)
+
+
+async def decode_async(img, executor=None):
+    """
+    Arguments: img: file path to a QOI, qoiz or strip file, executor: default get_executor().
+    Output: numpy array of shape (height, width, chanels).
+    """
+    loop = asyncio.get_running_loop()
+    return (await loop.run_in_executor(executor or get_executor(), my_qoi.decode, img)).data
@@ -0,0 +1,338 @@
+import argparse
+import asyncio
+import json
+import os
+import multiprocessing
+import platform
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+import my_qoi
+import qoi_async
+
+# Benchmarks for my_qoi.
+# Usage:
+#   python qoi_bench.py micro [image]               time, peak memory and allocated blocks per MP of the per pixel core
+#   python qoi_bench.py corpus [folder] [json]      encode/decode every image and save the results as JSON
+#   python qoi_bench.py serve [folder] [-c N ...]   concurrent requests to a local asyncio encode server
+
+def measure(function, *args):
+    """
+    Runs function(*args) twice: once for the time and once with tracemalloc for the peak memory
+    and the number of memory blocks that are still allocated when it returns (the result included).
+    Output: (seconds, peak traced memory in bytes, allocated blocks)
+    """
+    start = time.perf_counter()
+    function(*args)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    del result
+
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__)]  # The snapshots themselves
+    statistics = after.filter_traces(filters).compare_to(before.filter_traces(filters), "filename")
+    blocks = sum(stat.count_diff for stat in statistics)
+
+    return seconds, peak, blocks
+
+
+def micro_benchmark(path):
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    h, w, chanels = image.shape
+    megapixels = h * w / 1e6
+    encoded = my_qoi.encode_array(image).binary
+    data = bytes(encoded[14:-8])
+
+    encoder = my_qoi.encode_RGBA if chanels == 4 else my_qoi.encode_RGB
+    decoder = my_qoi.decode_RGBA if chanels == 4 else my_qoi.decode_RGB
+    cases = [
+        (encoder.__name__, encoder, (image, h, w)),
+        (encoder.__name__ + " stats", encoder, (image, h, w, my_qoi.QOIStats(chanels))),
+        (decoder.__name__, decoder, (data, h, w)),
+        (decoder.__name__ + " stats", decoder, (data, h, w, my_qoi.QOIStats(chanels))),
+        ("decode_array", my_qoi.decode_array, (data, h, w, chanels)),
+    ]
+
+    print(f"{path}: {w}x{h}, {chanels} chanels")
+    for name, function, args in cases:
+        seconds, peak, blocks = measure(function, *args)
+        print(
+            f"  {name:18} {seconds / megapixels:7.3f} s/MP  {peak / megapixels / 1e6:8.2f} MB/MP peak"
+            f"  {blocks / megapixels:10.0f} blocks/MP"
+        )
+
+
+def read_status(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024  # kB
+    raise KeyError(field)
+
+
+MIN_RSS_GROWTH = 1 << 20  # Smaller growth fits into memory the process already has, so VmHWM barely moves
+
+
+def traced_peak(function, args):
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def rss_growth(function, args):
+    """
+    Runs function(*args) and returns how much above the starting resident memory the process went, in bytes.
+    On Linux the peak (VmHWM) is reset first. Elsewhere, and when the growth is under MIN_RSS_GROWTH
+    (small images are decoded into memory that was already resident), tracemalloc is used.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")  # Reset VmHWM to the current resident memory
+        before = read_status("VmRSS")
+    except OSError:
+        return traced_peak(function, args)
+
+    function(*args)
+    growth = read_status("VmHWM") - before
+    if growth < MIN_RSS_GROWTH:
+        return traced_peak(function, args)
+    return growth
+
+
+def peak_memory(function, *args):
+    """
+    Peak memory of function(*args), measured in a fresh process. tracemalloc is only a fallback here,
+    because it slows the pixel by pixel decoder down by more than 10x.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(rss_growth, function, args).result()
+
+
+def benchmark_image(path):
+    """
+    Encodes and decodes one image with the default (numpy) paths.
+    Output: dict with sizes, throughput in megapixels per second, peak memory and chunk statistics.
+    """
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    h, w, chanels = image.shape
+    megapixels = h * w / 1e6
+
+    start = time.perf_counter()
+    binary = bytes(my_qoi.encode_array(image).binary)
+    encode_seconds = time.perf_counter() - start
+    data = binary[14:-8]
+
+    start = time.perf_counter()
+    my_qoi.decode_array(data, h, w, chanels)
+    decode_seconds = time.perf_counter() - start
+
+    encode_peak = peak_memory(my_qoi.encode_vectorized, image, h, w)
+    decode_peak = peak_memory(my_qoi.decode_array, data, h, w, chanels)
+
+    stats = my_qoi.QOIStats(chanels)
+    stats.add_chunks(data)
+    summary = stats.summary()
+
+    png_size = os.path.getsize(path)
+    return {
+        "image": os.path.basename(path),
+        "width": w,
+        "height": h,
+        "chanels": chanels,
+        "png_size": png_size,
+        "qoi_size": len(binary),
+        "bytes_per_pixel": len(binary) / (h * w),
+        "ratio_to_png": len(binary) / png_size,
+        "encode_mp_per_s": megapixels / encode_seconds,
+        "decode_mp_per_s": megapixels / decode_seconds,
+        "encode_peak_bytes": encode_peak,
+        "decode_peak_bytes": decode_peak,
+        "chunks": summary["chunks"],
+        "run_lengths": summary["run_lengths"],
+        "index_hit_rate": summary["index_hit_rate"],
+        "index_collision_rate": summary["index_collision_rate"],
+    }
+
+
+def corpus_benchmark(folder="images", output="bench_results.json"):
+    results = []
+    for file in sorted(os.listdir(folder)):
+        if os.path.splitext(file)[1].lower()[1:] not in my_qoi.SUPPORTED_FILE_TYPES:
+            continue
+        result = benchmark_image(os.path.join(folder, file))
+        results.append(result)
+        print(
+            f"{result['image']:20} {result['encode_mp_per_s']:6.2f} MP/s enc {result['decode_mp_per_s']:6.2f} MP/s dec"
+            f"  {result['bytes_per_pixel']:5.2f} B/px  {result['ratio_to_png']:5.2f} x PNG"
+            f"  {result['encode_peak_bytes'] / 1e6:6.1f} MB enc peak {result['decode_peak_bytes'] / 1e6:6.1f} MB dec peak"
+        )
+
+    pixels = sum(result["width"] * result["height"] for result in results)
+    total = {
+        "images": len(results),
+        "megapixels": pixels / 1e6,
+        "png_size": sum(result["png_size"] for result in results),
+        "qoi_size": sum(result["qoi_size"] for result in results),
+        "encode_seconds": sum(result["width"] * result["height"] / 1e6 / result["encode_mp_per_s"] for result in results),
+        "decode_seconds": sum(result["width"] * result["height"] / 1e6 / result["decode_mp_per_s"] for result in results),
+        "chunks": {
+            name: {key: sum(result["chunks"][name][key] for result in results) for key in ["count", "bytes", "pixels"]}
+            for name in my_qoi.QOIStats.CHUNK_NAMES
+        },
+    }
+    total["bytes_per_pixel"] = total["qoi_size"] / pixels
+    total["ratio_to_png"] = total["qoi_size"] / total["png_size"]
+    total["encode_mp_per_s"] = total["megapixels"] / total["encode_seconds"]
+    total["decode_mp_per_s"] = total["megapixels"] / total["decode_seconds"]
+
+    print(
+        f"total: {total['encode_mp_per_s']:.2f} MP/s enc, {total['decode_mp_per_s']:.2f} MP/s dec,"
+        f" {total['bytes_per_pixel']:.2f} B/px, {total['ratio_to_png']:.2f} x PNG"
+    )
+    for name, chunk in total["chunks"].items():
+        print(f"  {name:13} {chunk['count']:9} chunks {chunk['bytes']:9} B {chunk['pixels']:9} px")
+
+    report = {
+        "python": platform.python_version(),
+        "numpy": my_qoi.np.__version__,
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "images": results,
+        "total": total,
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved results in {output}")
+
+
+async def handle_encode(reader, writer, blocking=False):
+    """
+    Stand-in for the image service: reads an image path, answers with the QOI file in HTTP chunked encoding.
+    With blocking=True my_qoi.encode is called on the event loop instead, for comparison.
+    """
+    path = (await reader.readline()).decode().strip()
+    if blocking:
+        chunks = [bytes(my_qoi.encode(path).binary)]
+    else:
+        chunks = qoi_async.encode_chunks(path)
+
+    try:
+        if blocking:
+            for data in chunks:
+                writer.write(f"{len(data):x}\r\n".encode("ascii") + data + "\r\n".encode("ascii"))
+        else:
+            async for data in chunks:
+                writer.write(f"{len(data):x}\r\n".encode("ascii") + data + "\r\n".encode("ascii"))
+                await writer.drain()  # Backpressure: the next rows are encoded when the client has read these
+        writer.write("0\r\n\r\n".encode("ascii"))
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def request(port, path):
+    """
+    Output: (seconds to the first chunk, seconds to the whole response, response body size)
+    """
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(path.encode() + "\n".encode("ascii"))
+    await writer.drain()
+
+    first = None
+    size = 0
+    while True:
+        length = int(await reader.readline(), 16)
+        if first is None:
+            first = time.perf_counter() - start
+        if length == 0:
+            break
+        size += len(await reader.readexactly(length + 2)) - 2
+    writer.close()
+    await writer.wait_closed()
+    return first, time.perf_counter() - start, size
+
+
+async def loop_lag(stop, interval=0.01):
+    """
+    Output: the longest time the event loop was late to wake up a sleeping task.
+    """
+    lag = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(lag, time.perf_counter() - start - interval)
+    return lag
+
+
+async def serve_benchmark(folder="images", concurrency=(1, 4, 16), requests=32):
+    paths = [
+        os.path.join(folder, file)
+        for file in sorted(os.listdir(folder))
+        if os.path.splitext(file)[1].lower()[1:] in my_qoi.SUPPORTED_FILE_TYPES
+    ]
+    pixels = {}
+    for path in paths:
+        image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        pixels[path] = image.shape[0] * image.shape[1]
+
+    for blocking in [False, True]:
+        server = await asyncio.start_server(lambda r, w: handle_encode(r, w, blocking), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        for clients in concurrency:
+            jobs = [paths[i % len(paths)] for i in range(requests)]
+            semaphore = asyncio.Semaphore(clients)
+
+            async def limited(path):
+                async with semaphore:
+                    return await request(port, path)
+
+            stop = asyncio.Event()
+            lag = asyncio.create_task(loop_lag(stop))
+            start = time.perf_counter()
+            results = await asyncio.gather(*(limited(path) for path in jobs))
+            seconds = time.perf_counter() - start
+            stop.set()
+            max_lag = await lag
+
+            megapixels = sum(pixels[path] for path in jobs) / 1e6
+            first = sorted(result[0] for result in results)
+            print(
+                f"{'blocking' if blocking else 'async':8} {clients:3} clients: {len(jobs) / seconds:6.2f} req/s"
+                f" {megapixels / seconds:6.2f} MP/s, first chunk median {first[len(first) // 2] * 1000:7.1f} ms,"
+                f" max loop lag {max_lag * 1000:7.1f} ms"
+            )
+        server.close()
+        await server.wait_closed()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="my_qoi benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    micro = commands.add_parser("micro", help="time, peak memory and allocated blocks per MP of the per pixel core")
+    micro.add_argument("image", nargs="?", default="images/kodim01.png")
+    corpus = commands.add_parser("corpus", help="encode and decode every image in a folder")
+    corpus.add_argument("folder", nargs="?", default="images")
+    corpus.add_argument("output", nargs="?", default="bench_results.json")
+    serve = commands.add_parser("serve", help="concurrent requests to a local asyncio encode server")
+    serve.add_argument("folder", nargs="?", default="images")
+    serve.add_argument("-c", "--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    serve.add_argument("-n", "--requests", type=int, default=32)
+    args = parser.parse_args()
+
+    if args.command == "micro":
+        micro_benchmark(args.image)
+    elif args.command == "corpus":
+        corpus_benchmark(args.folder, args.output)
+    else:
+        asyncio.run(serve_benchmark(args.folder, args.concurrency, args.requests))
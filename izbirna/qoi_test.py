@@ -1,28 +1,296 @@
-import my_qoi
+import argparse
+import hashlib
 import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
 import cv2
+import numpy as np
+
+import my_qoi
+
+# Usage: python qoi_test.py [folder] [-j workers] [--hash]
+# Every image is encoded into "encoded", decoded again and compared with the original in one numpy operation.
+# With --hash the decoded rows are streamed into a hash instead, so the decoded image is never held in memory.
+# Random row ranges are also decoded through a checkpoint sidecar (.qidx), also after the file was encoded again,
+# and from the strip container (qoit). A few shifted copies of the image are encoded as a sequence (qois).
+# zlib and lzma qoiz files are streamed in tiny blocks, and the first rows through pipe-like readers with short reads.
+
+# Import time budget: "import my_qoi" must not load OpenCV or PIL and must stay fast,
+# because short lived worker processes import it just to decode.
+IMPORT_TIME_BUDGET = 0.5  # seconds
+
+CHECKPOINT_ROWS = 16  # Small, so the random row ranges start at many different checkpoints
+STRIP_HEIGHT = 16  # Small, so the random row ranges cross strip boundaries
+BLOCK_SIZE = 7  # Tiny and odd, so chunks are split between compressed and decompressed blocks
+PIPE_ROWS = 32  # Rows read through the pipe-like readers, one byte at a time is slow
+FRAMES = 6
+KEYFRAME_INTERVAL = 4
+RANGES = 8  # Random row ranges per image
+
+
+def check_import_time():
+    measure = "import sys, time; t = time.perf_counter(); import my_qoi; print(time.perf_counter() - t, 'cv2' in sys.modules or 'PIL' in sys.modules)"
+    import_time, loads_image_library = subprocess.run([sys.executable, "-c", measure], capture_output=True, text=True, check=True).stdout.split()
+    if loads_image_library == "True":
+        raise ImportError("import my_qoi loads cv2 or PIL")
+    if float(import_time) > IMPORT_TIME_BUDGET:
+        raise ImportError(f"import my_qoi took {float(import_time):.3f} s, budget is {IMPORT_TIME_BUDGET} s")
+    print(f"import my_qoi took {float(import_time):.3f} s")
+
+
+def first_mismatch(original, decoded):
+    """
+    Output: (y, x) of the first pixel that differs between the two images or None if they are equal.
+    """
+    different = np.any(original != decoded, axis=2)
+    if not different.any():
+        return None
+    return divmod(int(np.argmax(different)), original.shape[1])
+
+
+def compare(original, decoded, what):
+    if decoded.shape != original.shape:
+        raise ValueError(f"{what}: shape {decoded.shape} does not match {original.shape}")
+    mismatch = first_mismatch(original, decoded)
+    if mismatch is not None:
+        y, x = mismatch
+        raise ValueError(
+            f"{what}: first difference at x={x}, y={y},"
+            f" expected {original[y, x].tolist()}, got {decoded[y, x].tolist()}"
+        )
+
+
+def side_path(encoded_path, suffix):
+    """
+    Output: path next to encoded_path for the other encodings of the same image, e.g. encoded/kodim01_rows.qoi
+    """
+    return os.path.splitext(encoded_path)[0] + suffix
+
+
+def random_ranges(rng, height):
+    for _ in range(RANGES):
+        y0 = int(rng.integers(0, height))
+        yield y0, int(rng.integers(y0, height + 1))
+
+
+def verify_checkpoints(org_img_path, org_img, encoded_path, rng):
+    """
+    Random row ranges decoded through the .qidx sidecar must match the same rows of the original, and a sidecar
+    left over from another encoding (the file size does not match) must be ignored instead of seeking to wrong offsets.
+    """
+    path = side_path(encoded_path, "_rows.qoi")
+    encoded = my_qoi.encode(org_img_path, checkpoint_rows=CHECKPOINT_ROWS)
+    with open(path, "wb") as f:
+        f.write(encoded.binary)
+    with open(path + ".qidx", "wb") as f:
+        f.write(encoded.index)
+
+    for y0, y1 in random_ranges(rng, org_img.shape[0]):
+        compare(org_img[y0:y1], my_qoi.decode_rows(path, y0, y1), f"decode_rows({path}, {y0}, {y1})")
+
+    # Encode another image over the file and keep the old sidecar; only a different file size marks it as stale
+    for other in (org_img[::-1], 255 - org_img):
+        stale = my_qoi.encode_array(np.ascontiguousarray(other)).binary
+        if len(stale) != len(encoded.binary):
+            break
+    else:
+        return
+    with open(path, "wb") as f:
+        f.write(stale)
+    for y0, y1 in random_ranges(rng, org_img.shape[0]):
+        compare(other[y0:y1], my_qoi.decode_rows(path, y0, y1), f"decode_rows({path}, {y0}, {y1}) with a stale sidecar")
+
+
+def verify_strips(org_img_path, org_img, encoded_path, rng):
+    """
+    The strip container (qoit) must decode to the original as a whole and in random row ranges.
+    """
+    path = side_path(encoded_path, "_strips.qoi")
+    with open(path, "wb") as f:
+        f.write(my_qoi.encode(org_img_path, strip_height=STRIP_HEIGHT).binary)
+
+    compare(org_img, my_qoi.decode(path).data, f"decode({path})")
+    compare(org_img, my_qoi.decode_mmap(path).data, f"decode_mmap({path})")
+    for y0, y1 in random_ranges(rng, org_img.shape[0]):
+        compare(org_img[y0:y1], my_qoi.decode_strips(path, y0, y1)[0], f"decode_strips({path}, {y0}, {y1})")
+
 
-images_folder = "images"
-files = os.listdir(images_folder)
+def verify_sequence(org_img, encoded_path, rng):
+    """
+    Frames made by shifting a band of the image (so most of them are inter frames) are encoded into a sequence
+    container, then a random start:stop range from the middle and a single frame must decode to the same frames.
+    """
+    h = org_img.shape[0]
+    frames = []
+    for i in range(FRAMES):
+        frame = org_img.copy()
+        frame[h // 4 : h // 2] = np.roll(org_img[h // 4 : h // 2], 4 * i, axis=1)
+        frames.append(frame)
 
-for file in files:
-    org_img_path = os.path.join(images_folder, file)
-    encoded_path = os.path.join("encoded", file).replace("png", "qoi")
+    path = side_path(encoded_path, "_frames.qois")
+    with open(path, "wb") as f:
+        f.write(my_qoi.encode_sequence(frames, keyframe_interval=KEYFRAME_INTERVAL))
+    with open(path, "rb") as f:
+        types = my_qoi.read_sequence_index(f)[4]
+    if my_qoi.INTER_FRAME not in types:
+        raise ValueError(f"{path}: no inter frames, frame types {list(types)}")
 
+    start = int(rng.integers(1, FRAMES))
+    stop = int(rng.integers(start + 1, FRAMES + 1))
+    decoded = list(my_qoi.decode_sequence(path, start, stop))
+    if len(decoded) != stop - start:
+        raise ValueError(f"decode_sequence({path}, {start}, {stop}) gave {len(decoded)} frames")
+    for i, frame in enumerate(decoded, start=start):
+        compare(frames[i], frame, f"decode_sequence({path}, {start}, {stop}) frame {i}")
+    compare(frames[stop - 1], my_qoi.decode_frame(path, stop - 1), f"decode_frame({path}, {stop - 1})")
+
+
+class PipeReader:
+    """
+    Raw pipe-like reader: read returns only the few bytes that have "arrived", never the whole request.
+    """
+
+    def __init__(self, data, rng):
+        self.data = memoryview(data)
+        self.position = 0
+        self.rng = rng
+
+    def read(self, size=-1):
+        size = len(self.data) if size < 0 else size
+        end = min(self.position + min(size, int(self.rng.integers(1, 6))), len(self.data))
+        output = bytes(self.data[self.position : end])
+        self.position = end
+        return output
+
+
+class BufferedPipeReader(PipeReader):
+    """
+    Buffered pipe-like reader: read waits for all bytes, read1 returns the few that have arrived.
+    """
+
+    def read(self, size=-1):
+        output = bytearray()
+        while size < 0 or len(output) < size:
+            block = PipeReader.read(self, -1 if size < 0 else size - len(output))
+            if not block:
+                break
+            output.extend(block)
+        return bytes(output)
+
+    def read1(self, size=-1):
+        return PipeReader.read(self, size)
+
+
+def decode_blocks(stream, block_size):
+    """
+    Output: the whole image from decode_stream(stream, block_size) as one numpy array.
+    """
+    rows = my_qoi.decode_stream(stream, block_size)
+    w, h, chanels, _ = next(rows)
+    image = np.empty((h, w, chanels), dtype=np.uint8)
+    for y, row in enumerate(rows):
+        image[y] = row
+    return image
+
+
+def verify_compression(org_img_path, org_img, encoded_path):
+    """
+    zlib and lzma qoiz files must decode to the original when streamed in tiny blocks and when memory mapped.
+    """
+    for method in ("zlib", "lzma"):
+        path = side_path(encoded_path, f"_{method}.qoi")
+        with open(path, "wb") as f:
+            f.write(my_qoi.encode(org_img_path, compression=method).binary)
+
+        with open(path, "rb") as f:
+            compare(org_img, decode_blocks(f, BLOCK_SIZE), f"decode_stream({path}, block_size={BLOCK_SIZE})")
+        compare(org_img, my_qoi.decode_mmap(path).data, f"decode_mmap({path})")
+
+
+def verify_short_reads(org_img, rng):
+    """
+    decode_stream with a tiny block size over readers that return short reads, with and without read1,
+    must give the same rows as decode_array on the whole file.
+    """
+    crop = np.ascontiguousarray(org_img[:PIPE_ROWS])
+    data = my_qoi.encode_array(crop).binary
+    h, w, chanels = crop.shape
+    expected = my_qoi.decode_array(data, h, w, chanels, byte_index=14)
+    compare(crop, expected, f"decode_array of the first {PIPE_ROWS} rows")
+    for reader in (PipeReader, BufferedPipeReader):
+        compare(expected, decode_blocks(reader(data, rng), BLOCK_SIZE), f"decode_stream({reader.__name__})")
+
+
+def stream_digest(encoded_path):
+    with open(encoded_path, "rb") as f:
+        rows = my_qoi.decode_stream(f)
+        w, h, chanels, _ = next(rows)
+        digest = hashlib.blake2b()
+        for row in rows:
+            digest.update(row)
+    return (h, w, chanels), digest.digest()
+
+
+def verify_file(task):
+    org_img_path, encoded_path, use_hash = task
     org_img = cv2.imread(org_img_path, cv2.IMREAD_UNCHANGED)
 
     encoded = my_qoi.encode(org_img_path)
-
+    # The default (vectorized, banded, bulk run) encoder must stay byte identical to the pixel by pixel one
+    reference = my_qoi.encode(org_img_path, vectorized=False)
+    if encoded.binary != reference.binary:
+        pairs = enumerate(zip(encoded.binary, reference.binary))
+        offset = next((i for i, (a, b) in pairs if a != b), min(len(encoded.binary), len(reference.binary)))
+        raise ValueError(f"encode({org_img_path}) differs from encode(vectorized=False) at byte {offset}")
     with open(encoded_path, "wb") as f:
         f.write(encoded.binary)
 
-    decoded = my_qoi.decode(encoded_path)
+    matches = False
+    if use_hash:
+        shape, digest = stream_digest(encoded_path)
+        matches = shape == org_img.shape and digest == hashlib.blake2b(np.ascontiguousarray(org_img)).digest()
+
+    if not matches:
+        decoded = my_qoi.decode(encoded_path).data
+        if decoded.shape != org_img.shape:
+            raise ValueError(
+                f"Shape {decoded.shape} of {encoded_path} does not match {org_img.shape} of {org_img_path}"
+            )
+
+        mismatch = first_mismatch(org_img, decoded)
+        if mismatch is not None:
+            y, x = mismatch
+            chunk = my_qoi.find_chunk(bytes(encoded.binary[14:-8]), y * org_img.shape[1] + x)
+            raise ValueError(
+                f"Pixel data does not match between {org_img_path} and {encoded_path}: first difference at x={x},"
+                f" y={y}, expected {org_img[y, x].tolist()}, got {decoded[y, x].tolist()}, produced by {chunk}"
+            )
+
+    rng = np.random.default_rng(0)
+    verify_checkpoints(org_img_path, org_img, encoded_path, rng)
+    verify_strips(org_img_path, org_img, encoded_path, rng)
+    verify_sequence(org_img, encoded_path, rng)
+    verify_compression(org_img_path, org_img, encoded_path)
+    verify_short_reads(org_img, rng)
+
+    return f"{org_img_path} matches {encoded_path}"
+
 
-    channels = len(decoded.data[0][0])
-    for w in range(decoded.width):
-        for h in range(decoded.height):
-            for c in range(channels):
-                if org_img[h][w][c] != decoded.data[h][w][c]:
-                    raise ValueError(f"Pixel data does not match between {org_img_path} and {encoded_path}")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Round trip test for my_qoi")
+    parser.add_argument("folder", nargs="?", default="images")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--hash", action="store_true", help="compare streaming hashes instead of whole images")
+    args = parser.parse_args()
 
-    print(f"{org_img_path} matches {encoded_path}")
+    check_import_time()
+    os.makedirs("encoded", exist_ok=True)
+    tasks = [
+        (os.path.join(args.folder, file), os.path.join("encoded", file).replace("png", "qoi"), args.hash)
+        for file in sorted(os.listdir(args.folder))
+    ]
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        for message in executor.map(verify_file, tasks):
+            print(message)
@@ -0,0 +1,67 @@
+import argparse
+import os
+import tempfile
+
+import numpy as np
+
+import main
+
+# Usage: python entropy_test.py [folder] [--max-n n]
+# Compares the bounded-memory streaming estimate (main.stream_entropy) with the exact Hₙ of every file:
+# without a counter limit it must be exact, with a limit the exact value must lie between the bounds
+# and no bound may exceed 8 bits per byte. Small random files check the case where the counters never fill up.
+
+MAX_KEYS = [64, 4096, 1 << 16]
+CHUNK_SIZE = 1 << 18  # Small chunks, so many blocks cross a chunk boundary
+TOLERANCE = 1e-9
+
+
+def verify_file(path, max_n):
+    exact = main.analyze_orders(path, max_n, cache=False)[0]
+    for n, Hn in enumerate(exact, start=1):
+        estimate, lower, upper, error = main.stream_entropy(path, n, None, CHUNK_SIZE)
+        if error != 0 or any(abs(value - Hn) > TOLERANCE for value in (estimate, lower, upper)):
+            raise ValueError(f"{path}: exact streaming H_{n} = {estimate} [{lower}, {upper}], expected {Hn}")
+
+        for max_keys in MAX_KEYS:
+            estimate, lower, upper, _ = main.stream_entropy(path, n, max_keys, CHUNK_SIZE)
+            in_bounds = lower - TOLERANCE <= Hn <= upper + TOLERANCE
+            if not in_bounds or not lower - TOLERANCE <= estimate <= upper + TOLERANCE <= 8 + TOLERANCE:
+                raise ValueError(
+                    f"{path}: H_{n} = {Hn:.4f} with {max_keys} counters gave {estimate:.4f} [{lower:.4f}, {upper:.4f}]"
+                )
+            print(f"  H_{n}: {Hn:.4f}  ≈ {estimate:.4f} [{lower:.4f}, {upper:.4f}]  {max_keys} counters")
+
+    return f"{path} matches"
+
+
+def verify_random(count=100, seed=0):
+    """
+    Random files over a few symbols, counted with more counters than distinct blocks,
+    so nothing is ever dropped and the estimate and both bounds must equal the exact Hₙ.
+    """
+    rng = np.random.default_rng(seed)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "random.bin")
+        for _ in range(count):
+            symbols = int(rng.integers(1, 8))
+            rng.integers(0, symbols, int(rng.integers(1, 6000)), dtype=np.uint8).tofile(path)
+            exact = main.analyze_orders(path, 3, cache=False)[0]
+            for n, Hn in enumerate(exact, start=1):
+                estimate, lower, upper, error = main.stream_entropy(path, n, 1 << 16, 1000)
+                if error != 0 or not lower == estimate == upper or abs(estimate - Hn) > TOLERANCE:
+                    raise ValueError(f"random file: H_{n} = {Hn} gave {estimate} [{lower}, {upper}], error {error}")
+    return f"{count} random files match"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exact against bounded-memory entropy")
+    parser.add_argument("folder", nargs="?", default="datoteke")
+    parser.add_argument("--max-n", type=int, default=9)
+    args = parser.parse_args()
+
+    for file in sorted(os.listdir(args.folder)):
+        if file.endswith(".png"):
+            continue
+        print(verify_file(os.path.join(args.folder, file), args.max_n))
+    print(verify_random())
@@ -1,6 +1,20 @@
-from math import log2, log
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+from itertools import repeat
+from math import ceil, log2, log
+import os
 from pathlib import Path
 import matplotlib.pyplot as plt
+import numpy as np
+
+# Odd 64-bit multipliers of the two polynomial hashes used as keys for n > 8
+HASH_MULTIPLIERS = (0x100000001B3, 0x9E3779B97F4A7C15)
+
+# On-disk cache of counting results. Bump ANALYSIS_VERSION whenever the counting results change,
+# old entries are then never hit again and get evicted.
+ANALYSIS_VERSION = 1
+CACHE_DIR = Path(__file__).parent / "cache"
+CACHE_SIZE = 256 << 20  # bytes, least recently used entries are removed above it
 
 
 def sensible_Hn_values(path: str, max_n: int = 5) -> range:
@@ -118,31 +132,503 @@ def plot_levels_of_entropy(
     plt.close(fig)
 
 
-def my_analyze_file(path: str, n: int = 5):
+def ngram_keys(data: np.ndarray, n: int) -> np.ndarray:
+    """
+    Build one key per n-byte block (sliding window) of the data.
+
+    For n <= 8 the bytes are packed big-endian into the smallest unsigned int that fits, so equal keys mean
+    equal blocks. For n > 8 the key is a pair of 64-bit polynomial hashes (shape (blocks, 2)),
+    which practically never collide.
+
+    Args:
+        data: File content as a uint8 array.
+        n: Block length in bytes.
+
+    Returns:
+        Array of keys, one per block start.
+    """
+    m = len(data) - n + 1
+    if n <= 8:
+        dtype = np.uint16 if n <= 2 else np.uint32 if n <= 4 else np.uint64
+        keys = np.zeros(m, dtype=dtype)
+        for j in range(n):
+            keys <<= dtype(8)
+            keys |= data[j : j + m]
+        return keys
+
+    keys = np.zeros((m, 2), dtype=np.uint64)
+    for column, multiplier in enumerate(HASH_MULTIPLIERS):
+        h = keys[:, column]
+        for j in range(n):
+            h *= np.uint64(multiplier)  # Wraps around modulo 2**64
+            h += data[j : j + m]
+    return keys
+
+
+def count_ngrams(data: np.ndarray, n: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Count the n-byte blocks of the data with NumPy instead of a dict of bytes slices.
+    The keys are sorted, equal neighbours are grouped and the first occurrence is the smallest index in a group.
+
+    Args:
+        data: File content as a uint8 array.
+        n: Block length in bytes.
+
+    Returns:
+        Tuple: (index of the first occurrence of every distinct block, its count), in order of first occurrence.
+    """
+    m = len(data) - n + 1
+    if m <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    keys = ngram_keys(data, n)
+    if keys.ndim == 2:
+        # Sort by the first hash only, the second one just has to agree inside every group
+        order = np.argsort(keys[:, 0])
+        sorted_keys = keys[order]
+        new = sorted_keys[1:, 0] != sorted_keys[:-1, 0]
+        if np.any(~new & (sorted_keys[1:, 1] != sorted_keys[:-1, 1])):
+            order = np.lexsort((keys[:, 1], keys[:, 0]))
+            sorted_keys = keys[order]
+            new = np.any(sorted_keys[1:] != sorted_keys[:-1], axis=1)
+    else:
+        # 16-bit keys are radix sorted by the stable sort, wider ones are faster with the default one
+        order = np.argsort(keys, kind="stable" if keys.dtype == np.uint16 else None)
+        sorted_keys = keys[order]
+        new = sorted_keys[1:] != sorted_keys[:-1]
+
+    starts = np.flatnonzero(np.concatenate(([True], new)))
+    counts = np.diff(np.append(starts, m))
+    first = np.minimum.reduceat(order, starts)
+
+    by_first = np.argsort(first)
+    return first[by_first], counts[by_first]
+
+
+def distribution(data: bytes, n: int, first: np.ndarray, block_counts: np.ndarray):
+    """
+    Turn counted n-byte blocks into the result of my_analyze_file.
+
+    Args:
+        data: File content.
+        n: Block length in bytes.
+        first, block_counts: First occurrence and count of every distinct block, in order of first occurrence.
+
+    Returns:
+        Tuple: (Hₙ value, entropies dict, probabilities dict, counts dict)
+    """
+    # The dicts are filled in order of first occurrence like a counting loop would
+    counts: dict[bytes, int] = {data[i : i + n]: c for i, c in zip(first.tolist(), block_counts.tolist())}
+
+    total_blocks = len(data) - n + 1
+    probs = dict(zip(counts, (block_counts / total_blocks).tolist()))
+    entropies = {k: -p * log2(p) for k, p in probs.items()}
+
+    Hn = sum(entropies.values()) / n
+    return Hn, entropies, probs, counts
+
+
+def cache_entry(data: bytes, kind: str, n: int) -> Path:
+    """Cache file of a result, keyed by the file content, the kind of result, n and ANALYSIS_VERSION."""
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    return CACHE_DIR / f"{digest}-{kind}-{n}-v{ANALYSIS_VERSION}.npz"
+
+
+def cache_load(entry: Path) -> dict[str, np.ndarray] | None:
+    """
+    Load a cached result and mark it as recently used (the file modification time is the LRU order).
+
+    Returns:
+        Dict of the stored arrays, or None if the entry is missing or unreadable.
+    """
+    try:
+        with np.load(entry) as stored:
+            arrays = {name: stored[name] for name in stored.files}
+        os.utime(entry)
+    except (OSError, ValueError):
+        return None
+    return arrays
+
+
+def cache_store(entry: Path, **arrays: np.ndarray):
+    """Store arrays as an .npz file (written to a temporary file and renamed) and evict old entries."""
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    temporary = entry.with_name(f"{entry.stem}-{os.getpid()}.tmp")
+    with open(temporary, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(temporary, entry)
+    evict_cache(CACHE_SIZE)
+
+
+def evict_cache(size: int):
+    """Remove least recently used cache entries until they take at most size bytes."""
+    entries = []
+    for entry in CACHE_DIR.glob("*.npz"):
+        try:
+            entries.append((entry.stat(), entry))
+        except FileNotFoundError:  # Removed by another process
+            continue
+
+    total = sum(stat.st_size for stat, _ in entries)
+    for stat, entry in sorted(entries, key=lambda item: item[0].st_mtime_ns):
+        if total <= size:
+            break
+        entry.unlink(missing_ok=True)
+        total -= stat.st_size
+
+
+def smallest_uint(values: np.ndarray) -> np.ndarray:
+    """Values in the smallest unsigned int type that holds them, to keep cache entries compact."""
+    return values.astype(np.min_scalar_type(int(values.max()) if len(values) else 0))
+
+
+def my_analyze_file(path: str, n: int = 5, cache: bool = True):
     """
     Compute Hₙ (entropy per n-byte block) for a file.
 
     Args:
         path: Path to binary file.
         n: Block length in bytes.
+        cache: Reuse and store the counts in CACHE_DIR.
 
     Returns:
         Tuple: (Hₙ value, entropies dict, probabilities dict, counts dict)
     """
     data = Path(path).read_bytes()
-    counts: dict[bytes, int] = {}
+
+    entry = cache_entry(data, "counts", n) if cache else None
+    stored = cache_load(entry) if cache else None
+    if stored is not None:
+        return distribution(data, n, stored["first"].astype(np.int64), stored["counts"].astype(np.int64))
 
     # Count n-byte sequences
-    for i in range(len(data) - n + 1):
-        key = data[i : i + n]
-        counts[key] = counts.get(key, 0) + 1
+    first, block_counts = count_ngrams(np.frombuffer(data, dtype=np.uint8), n)
+    if cache:
+        cache_store(entry, first=smallest_uint(first), counts=smallest_uint(block_counts))
+    return distribution(data, n, first, block_counts)
 
-    total_blocks = len(data) - n + 1
-    probs = {k: v / total_blocks for k, v in counts.items()}
-    entropies = {k: -p * log2(p) for k, p in probs.items()}
 
-    Hn = sum(entropies.values()) / n
-    return Hn, entropies, probs, counts
+def analyze_orders(path: str, max_n: int = 25, distributions: bool = False, cache: bool = True):
+    """
+    Compute H₁ … H_max_n of a file with one read.
+
+    The positions are sorted by their first byte once. Going from n to n + 1 only refines the groups of equal
+    n-byte blocks by the next byte, so the sort works on already sorted runs and no block is ever built.
+    Blocks that are unique stay unique for every larger n, so they are counted and dropped from the sort.
+
+    Args:
+        path: Path to binary file.
+        max_n: Largest block length (smaller if the file is shorter).
+        distributions: Also return the dicts of my_analyze_file for every n.
+        cache: Reuse and store the Hₙ values in CACHE_DIR (only without distributions).
+
+    Returns:
+        Tuple: (list of Hₙ for n = 1 … max_n, list of (entropies, probabilities, counts) dicts or None).
+        Hₙ equals my_analyze_file(path, n)[0] up to rounding, exactly with distributions.
+    """
+    data = Path(path).read_bytes()
+    array = np.frombuffer(data, dtype=np.uint8)
+
+    cache = cache and not distributions
+    entry = cache_entry(data, "orders", max_n) if cache else None
+    stored = cache_load(entry) if cache else None
+    if stored is not None:
+        return stored["Hn"].tolist(), None
+
+    results = []
+    dists = [] if distributions else None
+    # Loop state: positions of the n-byte blocks sorted by block (order) and the sort key of every position (key)
+    order = np.argsort(array, kind="stable")
+    key = array[order].astype(np.int64)
+    singles = np.zeros(0, dtype=np.int64)  # Positions of blocks that are unique
+    for n in range(1, max_n + 1):
+        total_blocks = len(data) - n + 1
+        if total_blocks <= 0:
+            break
+
+        new = np.ones(len(order), dtype=bool)
+        new[1:] = key[1:] != key[:-1]
+        starts = np.flatnonzero(new)
+        block_counts = np.diff(np.append(starts, len(order)))
+
+        single = block_counts == 1
+        if single.any():
+            singles = np.concatenate((singles, order[starts[single]]))
+            multiple = np.repeat(~single, block_counts)
+            order = order[multiple]
+            new = new[multiple]
+            starts = np.flatnonzero(new)
+            block_counts = block_counts[~single]
+        unique_count = int(np.count_nonzero(singles < total_blocks))
+
+        if distributions:
+            first = np.concatenate((np.minimum.reduceat(order, starts), singles[singles < total_blocks]))
+            all_counts = np.concatenate((block_counts, np.ones(unique_count, dtype=np.int64)))
+            by_first = np.argsort(first)
+            Hn, entropies, probs, counts = distribution(data, n, first[by_first], all_counts[by_first])
+            dists.append((entropies, probs, counts))
+        else:
+            p = block_counts / total_blocks
+            H = -np.sum(p * np.log2(p)) + unique_count * log2(total_blocks) / total_blocks
+            Hn = float(H) / n
+        results.append(Hn)
+
+        # Refine for n + 1: (group of the n byte block, next byte). Blocks that run past the end are dropped.
+        if n < max_n:
+            group = np.cumsum(new) - 1
+            keep = order < total_blocks - 1
+            order = order[keep]
+            key = group[keep] * 256 + array[order + n]
+            sub = np.argsort(key, kind="stable")
+            order = order[sub]
+            key = key[sub]
+
+    if cache:
+        cache_store(entry, Hn=np.array(results))
+    return results, dists
+
+
+def read_chunks(path: str, n: int, chunk_size: int = 1 << 22):
+    """
+    Read a file in chunks for counting n-byte blocks without holding the whole file.
+
+    Every chunk after the first starts with the last n - 1 bytes of the previous one, so every block of the file
+    lies whole in exactly one chunk.
+
+    Args:
+        path: Path to binary file.
+        n: Block length in bytes.
+        chunk_size: New bytes read per chunk.
+
+    Yields:
+        Chunks as uint8 arrays.
+    """
+    tail = b""
+    with open(path, "rb") as f:
+        while block := f.read(chunk_size):
+            chunk = tail + block
+            tail = chunk[len(chunk) - n + 1 :] if n > 1 else b""
+            yield np.frombuffer(chunk, dtype=np.uint8)
+
+
+def sort_keys(keys: np.ndarray) -> np.ndarray:
+    """
+    Stable sort order of block keys from ngram_keys (1-D ints or pairs of hashes).
+
+    On a concatenation of sorted runs the stable sort only merges the runs.
+    """
+    if keys.ndim == 2:
+        return np.lexsort((keys[:, 1], keys[:, 0]))
+    return np.argsort(keys, kind="stable")
+
+
+def group_starts(sorted_keys: np.ndarray) -> np.ndarray:
+    """Indices where a new key starts in sorted keys."""
+    new = sorted_keys[1:] != sorted_keys[:-1]
+    if sorted_keys.ndim == 2:
+        new = np.any(new, axis=1)
+    return np.flatnonzero(np.concatenate(([True], new)))
+
+
+def count_keys(keys: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Count table of block keys.
+
+    Returns:
+        Tuple: (distinct keys in sorted order, their counts, index of their first occurrence).
+    """
+    if keys.ndim == 2:
+        order = sort_keys(keys)
+    else:
+        # Same sort choice as count_ngrams, the first occurrence is the smallest index in a group
+        order = np.argsort(keys, kind="stable" if keys.dtype == np.uint16 else None)
+    sorted_keys = keys[order]
+    starts = group_starts(sorted_keys)
+    return sorted_keys[starts], np.diff(np.append(starts, len(keys))), np.minimum.reduceat(order, starts)
+
+
+def merge_counts(tables: list[tuple[np.ndarray, ...]]) -> tuple[np.ndarray, ...]:
+    """
+    Merge count tables sorted by key (sorted-array merge, no dicts).
+
+    The tables are concatenated and stable sorted once, which only merges the sorted runs.
+
+    Args:
+        tables: (keys, counts) or (keys, counts, first occurrence) tables, each sorted by key.
+
+    Returns:
+        Tuple: (distinct keys in sorted order, summed counts[, smallest first occurrence]).
+    """
+    keys = np.concatenate([table[0] for table in tables])
+    order = sort_keys(keys)
+    keys = keys[order]
+    if not len(keys):
+        return (keys, *(np.concatenate(column) for column in list(zip(*tables))[1:]))
+
+    starts = group_starts(keys)
+    merged = [keys[starts], np.add.reduceat(np.concatenate([table[1] for table in tables])[order], starts)]
+    if len(tables[0]) > 2:
+        merged.append(np.minimum.reduceat(np.concatenate([table[2] for table in tables])[order], starts))
+    return tuple(merged)
+
+
+def stream_entropy(path: str, n: int = 5, max_keys: int | None = None, chunk_size: int = 1 << 20):
+    """
+    Compute Hₙ of a file in chunks with bounded memory.
+
+    Every chunk is counted exactly and merged into a summary of at most max_keys counters (mergeable space-saving):
+    a block that is not in the summary gets the largest count an untracked block can have (`bound`) added to its
+    count and recorded as its error, and after the merge only the max_keys largest counters are kept.
+    So every counter overestimates its block by at most its error ≤ bound, and untracked blocks occur at most
+    bound times. From that:
+        upper bound: tracked blocks at their smallest count, the rest of the blocks all distinct, at most 8n bits,
+        lower bound: -p log p ≥ p log(T / largest possible count), blocks filled up from the largest counters.
+    Without max_keys the summary is exact (memory grows with the distinct blocks) and all three values are equal.
+
+    Args:
+        path: Path to binary file.
+        n: Block length in bytes.
+        max_keys: Maximum number of counters, None for exact counting.
+        chunk_size: New bytes read per chunk (counting a chunk takes about 100 × chunk_size bytes).
+
+    Returns:
+        Tuple: (Hₙ estimate (middle of the bounds), lower bound, upper bound, largest overestimate of any counter).
+    """
+    keys = counts = errors = None
+    bound = 0  # Largest count of a block that is not in the summary
+    total_blocks = 0
+    for chunk in read_chunks(path, n, chunk_size):
+        if len(chunk) < n:
+            continue
+        total_blocks += len(chunk) - n + 1
+        chunk_keys, chunk_counts, _ = count_keys(ngram_keys(chunk, n))
+        if keys is None:
+            keys, counts, errors = chunk_keys, chunk_counts, np.zeros_like(chunk_counts)
+        else:
+            # New blocks may have been seen up to bound times before, blocks in both tables must not get it twice
+            all_keys = np.concatenate((keys, chunk_keys))
+            order = sort_keys(all_keys)
+            all_keys = all_keys[order]
+            starts = group_starts(all_keys)
+            both = np.diff(np.append(starts, len(all_keys))) == 2
+            keys = all_keys[starts]
+            counts = np.add.reduceat(np.concatenate((counts, chunk_counts + bound))[order], starts) - bound * both
+            errors = np.add.reduceat(np.concatenate((errors, np.full_like(chunk_counts, bound)))[order], starts)
+            errors -= bound * both
+
+        if max_keys is not None and len(keys) > max_keys:
+            kept = np.argpartition(counts, len(counts) - max_keys)
+            bound = max(bound, int(counts[kept[: len(counts) - max_keys]].max()))
+            kept = np.sort(kept[len(counts) - max_keys :])
+            keys, counts, errors = keys[kept], counts[kept], errors[kept]
+
+    if not total_blocks:
+        return 0.0, 0.0, 0.0, 0
+
+    T = total_blocks
+    counts = counts.astype(np.float64)
+    if bound == 0:
+        # No counter was ever dropped, so all counts are exact
+        p = counts / T
+        H = float(-np.sum(p * np.log2(p))) / n
+        return H, H, H, 0
+
+    smallest = counts - errors
+
+    # Upper: tracked blocks at their smallest count, all other blocks occur once, at most 8 bits per byte
+    p = smallest[smallest > 0] / T
+    upper = -np.sum(p * np.log2(p)) + (T - smallest.sum()) / T * log2(T)
+    upper = min(upper, 8 * n)
+
+    # Lower: after the smallest counts, fill the largest counters first, the rest into blocks of count bound
+    by_size = np.argsort(-counts)
+    room = np.minimum(np.cumsum((counts - smallest)[by_size]), T - smallest.sum())
+    filled = smallest.copy()
+    filled[by_size] += np.diff(np.concatenate(([0.0], room)))
+    rest = T - filled.sum()
+    lower = np.sum(filled / T * np.log2(T / counts)) + (rest / T * log2(T / bound) if rest > 0 else 0.0)
+    lower = min(lower, upper)  # They can cross by rounding when the bounds are tight
+
+    return float(lower + upper) / 2 / n, float(lower) / n, float(upper) / n, bound
+
+
+def compare_streaming(path: str, n_values: list[int], max_keys: int = 1 << 16):
+    """Print exact Hₙ next to the bounded-memory estimate and its bounds."""
+    exact = analyze_orders(path, max(n_values))[0]
+    for n in n_values:
+        estimate, lower, upper, error = stream_entropy(path, n, max_keys)
+        print(f"  H_{n}: {exact[n - 1]:.4f}  ≈ {estimate:.4f} [{lower:.4f}, {upper:.4f}]  count error ≤ {error}")
+
+
+def count_range(path: str, n: int, start: int, stop: int):
+    """
+    Count the n-byte blocks that start in [start, stop) of a file (one task of parallel_count).
+
+    The last block ends n - 1 bytes after stop, so neighbouring ranges read n - 1 bytes of the same data
+    but every block is counted by exactly one range.
+
+    Returns:
+        Tuple: (distinct keys in sorted order, their counts, file offset of their first occurrence).
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        chunk = np.frombuffer(f.read(stop - start + n - 1), dtype=np.uint8)
+    keys, counts, first = count_keys(ngram_keys(chunk, n))
+    return keys, counts, first + start
+
+
+def parallel_count(path: str, n: int, workers: int | None = None, chunk_size: int | None = None):
+    """
+    count_ngrams of a file counted in chunks by a process pool, the partial tables are merged with merge_counts.
+
+    Args:
+        path: Path to binary file.
+        n: Block length in bytes.
+        workers: Number of processes (default: one per core).
+        chunk_size: Blocks counted per task (default: an equal share per worker, at most 2^24).
+            Every task adds its distinct blocks to the merge, so fewer and larger tasks merge faster.
+
+    Returns:
+        Tuple: (index of the first occurrence of every distinct block, its count), in order of first occurrence.
+    """
+    total_blocks = Path(path).stat().st_size - n + 1
+    if total_blocks <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    workers = workers or os.cpu_count() or 1
+    chunk_size = chunk_size or min(ceil(total_blocks / workers), 1 << 24)
+    starts = range(0, total_blocks, chunk_size)
+    stops = [min(start + chunk_size, total_blocks) for start in starts]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        tables = list(executor.map(count_range, repeat(path), repeat(n), starts, stops))
+
+    _, counts, first = merge_counts(tables)
+    by_first = np.argsort(first)
+    return first[by_first], counts[by_first]
+
+
+def parallel_analyze_file(path: str, n: int = 5, workers: int | None = None):
+    """
+    my_analyze_file with the counting spread over a process pool.
+
+    Returns:
+        Tuple: (Hₙ value, entropies dict, probabilities dict, counts dict)
+    """
+    first, block_counts = parallel_count(path, n, workers)
+    return distribution(Path(path).read_bytes(), n, first, block_counts)
+
+
+def analyze_batch(paths: list[str], max_n: int = 5, workers: int | None = None) -> dict[str, list[float]]:
+    """
+    analyze_orders of many files, one file per process, largest files first.
+
+    Returns:
+        Dict mapping path → list of Hₙ for n = 1 … max_n.
+    """
+    by_size = sorted(paths, key=lambda path: Path(path).stat().st_size, reverse=True)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = dict(zip(by_size, executor.map(analyze_orders, by_size, repeat(max_n))))
+    return {path: results[path][0] for path in paths}
 
 
 if __name__ == "__main__":
@@ -152,11 +638,10 @@ if __name__ == "__main__":
     image_files = [f"{base}/iss_{r}.jpg" for r in ["0480", "0960", "1920", "2560", "3840", "7680"]]
     audio_files = [f"{base}/posnetek.{ext}" for ext in ["aiff", "flac", "m4a", "mp3", "ogg", "raw", "wav"]]
 
-    # Compute and print entropies
-    for group in [text_file, *image_files, *audio_files]:
+    # Compute and print entropies, one file per core
+    for group, results in analyze_batch([text_file, *image_files, *audio_files], 5).items():
         print(f"\nFile: {group}")
-        for n in range(1, 6):
-            Hn = my_analyze_file(group, n)[0]
+        for n, Hn in enumerate(results, start=1):
             print(f"  H_{n}: {Hn:.3f}")
 
     # Plot example probability distributions
@@ -178,13 +663,13 @@ if __name__ == "__main__":
 
     # Entropy levels for multiple data types
     print(f"\tFile: {text_file}")
-    result_text = [my_analyze_file(text_file, n=n)[0] for n in range(1, 26)]
+    result_text = analyze_orders(text_file, 25)[0]
     print(f"\tFile: {image_files[-1]}")
-    result_image = [my_analyze_file(image_files[-1], n=n)[0] for n in range(1, 26)]
+    result_image = analyze_orders(image_files[-1], 25)[0]
     print(f"\tFile: {audio_files[0]}")
-    result_audio = [my_analyze_file(audio_files[0], n=n)[0] for n in range(1, 26)]
+    result_audio = analyze_orders(audio_files[0], 25)[0]
     print(f"\tFile: {audio_files[3]}")
-    result_audio_mp3 = [my_analyze_file(audio_files[3], n=n)[0] for n in range(1, 26)]
+    result_audio_mp3 = analyze_orders(audio_files[3], 25)[0]
 
     plot_levels_of_entropy(
         [result_text, result_image, result_audio, result_audio_mp3],
@@ -194,3 +679,7 @@ if __name__ == "__main__":
         title="Entropija pri različnih tipih datotek",
         file=f"{base}/entropija_tipov.png",
     )
+
+    # Bounded-memory streaming estimate next to the exact values
+    print(f"\nFile: {text_file} (at most 2^16 counters)")
+    compare_streaming(text_file, [1, 2, 3, 5, 8, 12])